@@ -7,15 +7,127 @@ Created on Thu Sep 10 21:51:23 2015
 
 import matplotlib
 import matplotlib.pyplot as plt
-# This is to prevent overlapping annotations from being dragged simultaneously
-# due to the multi-threaded nature of the matplotlib gui.
-import threading
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+import bisect
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+import weakref
+from collections import OrderedDict
 ###########################
 # Globals
 ###########################
 attr_name = 'annotations_line2d'
+# Attribute used to cache the LineIndex on each Line2D artist
+index_attr_name = 'annotations_line2d_index'
+# Attribute used to cache the AxesPickIndex on each axes
+pick_attr_name = 'annotations_line2d_pick'
+# Attribute used to hold the BlitManager on each canvas
+blit_attr_name = 'annotations_line2d_blit'
+# Attribute used to hold the AnnotationDispatcher on each canvas
+dispatch_attr_name = 'annotations_line2d_dispatch'
+# Attribute used to remember which lines of an axes were already checked
+seen_attr_name = 'annotations_line2d_seen'
+# Attribute used to hold the hover tooltip annotation on each axes
+tooltip_attr_name = 'annotations_line2d_tooltip'
+# Attribute used to hold the AnnotationLayout on each canvas
+layout_attr_name = 'annotations_line2d_layout'
+# Attribute used to attach a FullResolutionSource to a Line2D artist
+source_attr_name = 'annotations_line2d_source'
+# Attribute used to attach a LineStream to a Line2D artist
+stream_attr_name = 'annotations_line2d_stream'
+# Maximum number of formatted annotation strings remembered per line
+text_cache_size = 256
 
 _event= None # Used for debugging
+_registry = None # The AnnotationRegistry (see get_registry)
+
+
+###########################
+# Instrumentation
+###########################
+# {name: _Histogram} while instrumentation is enabled, otherwise None.
+_histograms = None
+
+
+class _Histogram(object):
+    """Call count, total, min, max and log2 buckets of durations in microseconds."""
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count=0
+        self.total=0.0
+        self.min=float('inf')
+        self.max=0.0
+        self.buckets=[0]*40 # Bucket n holds durations in [2**(n-1), 2**n) microseconds
+
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min=seconds
+        if seconds > self.max:
+            self.max=seconds
+        self.buckets[min(int(seconds*1e6).bit_length(), 39)] += 1
+
+
+    def percentile(self, q):
+        """Upper edge (in seconds) of the bucket holding the q-th percentile."""
+        target=self.count*q/100.
+        running=0
+        for n, count in enumerate(self.buckets):
+            running += count
+            if running >= target and count:
+                return min(2**n * 1e-6, self.max)
+        return self.max
+
+
+def _instrumented(name):
+    """Decorator to time every call of a function while instrumentation is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _histograms is None:
+                return func(*args, **kwargs)
+            start=time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _timed(name, func, *args):
+    """Call func(*args), timing it while instrumentation is enabled."""
+    if _histograms is None:
+        return func(*args)
+    start=time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def _record(name, seconds):
+    histogram=_histograms.get(name)
+    if histogram is None:
+        histogram=_histograms[name]=_Histogram()
+    histogram.record(seconds)
+
+
+def _draw_canvas(canvas):
+    """Full canvas draw (timed as 'draw')."""
+    _timed('draw', canvas.draw)
+
+
+def _blit_canvas(canvas, bbox):
+    """Blit a region of the canvas (timed as 'blit')."""
+    _timed('blit', canvas.blit, bbox)
 
 
 ###########################
@@ -30,34 +142,94 @@ class DraggableAnnotationLine2D(matplotlib.offsetbox.DraggableBase):
     Right-click to delete the annotation.
     The original annotation artist is in self.ref_artist.
     We save additional info in self.line, self.index, and self.formatter.
+    The line is only weakly referenced, so an annotation never keeps a removed
+    line (and its data) alive. See AnnotationRegistry.
+    If frame_rate is given, mouse motion during a drag is coalesced so the
+    annotation is redrawn at most frame_rate times per second.
+    If auto_layout is True, the annotations it overlaps after a left-drag are
+    moved out of the way (see AnnotationLayout).
+    If the annotation is in an AnnotationLink (self.link), the other
+    annotations of the link follow it when it is slid with the middle button.
+    Mouse events are not connected per annotation. The AnnotationDispatcher
+    of the canvas picks the topmost annotation under the cursor and calls
+    start_drag(), on_motion() and on_release() on that annotation only.
     """
-    # Class-level lock to make sure only ONE annotation is moved at a time.
-    # Due to QT's multi—threaded nature, it‘s best to use a real thread lock.
-    _drag_lock=threading.Lock()
     _counter=0 # Just a counter to give each annotation a unique ID.
     
-    def __init__(self, ref_artist, line=None, index=None, formatter=None, use_blit=True):
+    def __init__(self, ref_artist, line=None, index=None, formatter=None, use_blit=True, draw=True, frame_rate=None, auto_layout=False):
         # Use the base init (This isn‘t C++ where the parent is called automatically.)
         super().__init__(ref_artist, use_blit=use_blit)
+        # The dispatcher handles all mouse events, so drop the base class
+        # callbacks and don't make matplotlib test the artist on every pick.
+        super().disconnect()
+        self.ref_artist.set_picker(None)
         # Store the other parameters
         self.line=line
         self.index=index
         self.formatter=formatter
+        self.background=None # The canvas without this annotation, while dragging
+        self.auto_layout=auto_layout
+        self.link=None # AnnotationLink, see link_annotations()
+        self._followers=[] # Linked annotations on this canvas, while sliding
+        self._followed=[] # Linked annotations (on any canvas) moved by this slide
+        # Motion throttling: only the latest motion event is kept
+        self.frame_rate=frame_rate
+        self._pending_motion=None # Latest motion event, not yet applied
+        self._last_frame=0.0
+        self._motion_timer=None
         # Create a unique ID for this annotation (for debugging)
         DraggableAnnotationLine2D._counter += 1
         DraggableAnnotationLine2D._counter %= 2**31 # Not too big
         self.id = DraggableAnnotationLine2D._counter
         #print('Init',self.id)
-        if formatter is not None:
-            # Get and set the text
+        get_dispatcher(self.canvas).register(self)
+        get_registry().add(self)
+        stream=None if line is None else getattr(line, stream_attr_name, None)
+        if stream is not None:
+            stream.add(self) # Anchor to the sample, not the index
+        if formatter is not None and not self.ref_artist.get_text():
+            # Get and set the text (unless it was already formatted in a batch)
             self.ref_artist.set_text(self.formatter(line, index))
         #Update the canvas to make sure the annotation is visible
-        self.canvas.draw()
+        if not draw:
+            pass # The caller will draw (see AnnotationPicker.annotate_many)
+        elif self._use_blit:
+            # Only draw the new annotation on top (full draw if the view changed)
+            get_blit_manager(self.canvas).draw(self.ref_artist)
+        else:
+            _draw_canvas(self.canvas)
     
     
+    @property
+    def canvas(self):
+        """The canvas of the annotation, kept after the artist is removed."""
+        canvas=self.__dict__.get('_canvas')
+        if canvas is None:
+            canvas=self._canvas=self.ref_artist.get_figure().canvas
+        return canvas
+
+
+    @canvas.setter
+    def canvas(self, canvas):
+        # Older DraggableBase sets this attribute itself
+        self._canvas=canvas
+
+
+    @property
+    def line(self):
+        """The annotated Line2D, or None if it was never given or no longer exists."""
+        return None if self._line is None else self._line()
+
+
+    @line.setter
+    def line(self, line):
+        self._line = None if line is None else weakref.ref(line)
+
+
     def artist_picker(self, artist, event):
         """
-        Determines if the artist should enable move for this mouse button event
+        Determines if the artist should enable move for this mouse button event.
+        Called by the AnnotationDispatcher, topmost annotation first.
         """
         # Make sure this only happens with a click. Ignore scroll.
         # Left or Right click works on all of these annotations
@@ -70,17 +242,12 @@ class DraggableAnnotationLine2D(matplotlib.offsetbox.DraggableBase):
             #print('Picked',self.id)
             drag = self.ref_artist.get_bbox_patch().contains(event)
             if drag[0]:
-                #Make sure no other annotation are dragging.
-                # wait=False means no block. True if a successful lock.
-                if DraggableAnnotationLine2D._drag_lock.acquire(False):
-                    # Record the mouse button
-                    self.button=event.button
-                    #print('Claim',self.id)
-                    return drag
+                return drag
         # If we made it here, then we're not moving
         return (False, None)
 
 
+    @_instrumented('save_offset')
     def save_offset(self):
         """
         On button-down, this saves the current location of the annotation.
@@ -95,13 +262,15 @@ class DraggableAnnotationLine2D(matplotlib.offsetbox.DraggableBase):
             self.drag_trans_mat = self.ref_artist.get_transform().inverted().get_matrix()
         elif self.button == 2:
             # Middle-click. We need some additional information to slide the data.
-            self.xydata=self.line.get_xydata() #just makes it easier (this does NOT copy)
+            # The line index is rebuilt only if the line data has changed.
+            self.line_index=get_line_index(self.line)
             # we need the pixels of the starting data point (not the cursor)
-            self.drag_start_pixels = self.ref_artist.get_axes().transData.transform(self.ref_artist.xy)
+            self.drag_start_pixels = self.ref_artist.axes.transData.transform(self.ref_artist.xy)
             # Get the translation from pixels to data for annotation.xy
-            self.drag_trans_pix2dat = self.ref_artist.get_axes().transData.inverted()
+            self.drag_trans_pix2dat = self.ref_artist.axes.transData.inverted()
             
 
+    @_instrumented('update_offset')
     def update_offset(self, dx, dy):
         """
         dx and dy is the total pixel offset from the point where the mouse
@@ -117,48 +286,170 @@ class DraggableAnnotationLine2D(matplotlib.offsetbox.DraggableBase):
         elif self.button == 2: # Middle—click
             # We may have a logarithmic scale, but update offset only gives us delta pixels.
             # Add the delta to the starting pixels, then convert to data coordinates
-            pixels_dxy = matplotlib.numpy.array((dx,dy))
-            new_data_xy = self.drag_trans_pix2dat.transform(self.drag_start_pixels+pixels_dxy)
-            # Determine if the new data coordinates reach or exceed the next line data point.
-            index=self.index
-            while (index > 0) and (self.xydata[index-1][0] > new_data_xy[0]):
-                #Move left
-                index -= 1
-            while (index < self.xydata.shape[0] - 1) and (self.xydata[index+1][0] < new_data_xy[0]):
-                # Move right
-                index += 1
+            pixels_dxy = np.array((dx,dy))
+            new_pixels = self.drag_start_pixels+pixels_dxy
+            if self.line_index.monotonic:
+                # Determine if the new data coordinates reach or exceed the next line data point.
+                new_data_xy = self.drag_trans_pix2dat.transform(new_pixels)
+                index=self.line_index.slide(self.index, new_data_xy[0])
+            else:
+                # x is not sorted, so just use the closest point to the cursor.
+                index=self.line_index.nearest_pixel(new_pixels, self.ref_artist.axes)
             if index != self.index:
                 # we moved an index! Update the annotation
-                self.ref_artist.xy=self.xydata[index,:]
+                self.ref_artist.xy=self.line_index.point(index)
                 self.index=index
                 if self.formatter is not None:
                     # Update the text in the annotation
                     self.ref_artist.set_text(self.formatter(self.line, index))
+                if self.link is not None:
+                    # Linked annotations follow to the same x
+                    for other in self.link.follow(self, self.ref_artist.xy[0]):
+                        if other not in self._followed:
+                            self._followed.append(other)
+                        if other.canvas is not self.canvas:
+                            get_dispatcher(other.canvas).moved(other)
+                            get_layout(other.canvas).invalidate()
+                            other.canvas.draw_idle()
  
            
+    def start_drag(self, event):
+        """Called by the dispatcher on button-down, once this annotation was chosen."""
+        #print('Claim',self.id)
+        # Record the mouse button and position
+        self.button=event.button
+        self.mouse_x=event.x
+        self.mouse_y=event.y
+        self.save_offset()
+        self.got_artist=True
+        if self.button == 2 and self.link is not None:
+            self._followers=[a for a in self.link.annotations if a is not self and
+                             a.ref_artist.get_figure() is not None and a.canvas is self.canvas]
+        # No hover tooltips while dragging
+        get_blit_manager(self.canvas).hide_overlays()
+        if self._use_blit and self.button != 3:
+            # A right-click doesn't move anything. remove() erases it on release.
+            # Save the background without this annotation (or those that follow it),
+            # then draw them on top.
+            fig=self.ref_artist.get_figure()
+            for annotation in self._followers + [self]:
+                annotation.ref_artist.set_animated(True)
+            _draw_canvas(self.canvas)
+            self.background=self.canvas.copy_from_bbox(fig.bbox)
+            self._draw_animated()
+            _blit_canvas(self.canvas, fig.bbox)
+
+
+    def _draw_animated(self):
+        """Draw this annotation and its followers, each on its own axes."""
+        for annotation in self._followers + [self]:
+            annotation.ref_artist.axes.draw_artist(annotation.ref_artist)
+
+
+    def on_motion(self, evt):
+        """
+        Called by the dispatcher on mouse motion while dragging.
+        If frame_rate is set, the event may be held until the frame budget allows.
+        Only the latest event is kept, so a backlog of events costs nothing.
+        """
+        if not self.got_artist or self.button == 3:
+            return # A right-click doesn't move anything (and saved no background)
+        if self.frame_rate is None:
+            self._apply_motion(evt)
+            return
+        self._pending_motion=evt
+        wait=self._last_frame + 1.0/self.frame_rate - time.perf_counter()
+        if wait <= 0:
+            self._flush_motion()
+        else:
+            # Make sure the last position is shown, even if the mouse stops moving.
+            if self._motion_timer is None:
+                self._motion_timer=self.canvas.new_timer()
+                self._motion_timer.single_shot=True
+                self._motion_timer.add_callback(self._flush_motion)
+            self._motion_timer.interval=max(int(wait*1000), 1)
+            self._motion_timer.start()
+
+
+    def _flush_motion(self):
+        """Apply the pending motion event, if any."""
+        if self._pending_motion is None:
+            return
+        evt = self._pending_motion
+        self._pending_motion=None
+        if self.got_artist:
+            self._apply_motion(evt)
+        # Measure from the end of the draw, so slow draws don't pile up.
+        self._last_frame=time.perf_counter()
+
+
+    def _apply_motion(self, evt):
+        """Move the annotation for this mouse position and redraw it."""
+        self.update_offset(evt.x - self.mouse_x, evt.y - self.mouse_y)
+        if self._use_blit:
+            # One blit for every moved annotation, whatever axes they are in
+            fig=self.ref_artist.get_figure()
+            self.canvas.restore_region(self.background)
+            self._draw_animated()
+            _blit_canvas(self.canvas, fig.bbox)
+        else:
+            _draw_canvas(self.canvas)
+
+
+    @_instrumented('finalize_offset')
     def finalize_offset(self):
         """Called when the mouse button is released, if this was picked in the first place."""
         #print('Finalize',self.id)
+        # Apply the final mouse position so the result is exact
+        if self._motion_timer is not None:
+            self._motion_timer.stop()
+        self._flush_motion()
         if self.button == 2 and self.formatter is not None:
             # Print out annotation text for the user to copy/paste
             self.print_annotation()
         elif self.button == 3:
             # Delete annotation
             self.remove()
+        if self.button == 2:
+            for annotation in [self] + self._followed:
+                stream=getattr(annotation.line, stream_attr_name, None)
+                if stream is not None:
+                    stream.add(annotation) # Anchor to the new sample
+            self._followed=[]
+        # Don't hold onto the line data between drags
+        self.line_index=None
         
     
     def on_release(self,event):
         """
-        Called when the mouse button is released, whether or not this was picked.
-        We extend this function so that we are guaranteed to release the thread lock.
+        Called by the dispatcher when the mouse button is released after start_drag().
         """
-        # Call the original
-        super().on_release(event)
-        #Everyone tries to remove the block, just in case the controlling annotation was removed.
-        try:
-            DraggableAnnotationLine2D._drag_lock.release()
-        except RuntimeError:
-            pass # Already released. Not a concern.
+        if not self.got_artist:
+            return
+        self.finalize_offset()
+        self.got_artist=False
+        if self._use_blit:
+            # The annotation is already drawn on the canvas. Draw it normally from now on.
+            for annotation in self._followers + [self]:
+                annotation.ref_artist.set_animated(False)
+            self.background=None # A copy of the whole canvas. Don't keep it.
+        followers, self._followers = self._followers, []
+        layout=getattr(self.canvas, layout_attr_name, None)
+        if self.button == 1 and self.auto_layout:
+            # Keep the annotation where it was dropped and move its new neighbours
+            if get_layout(self.canvas).place(self.ref_artist, fixed=True):
+                get_dispatcher(self.canvas).invalidate() # The neighbours moved
+                _draw_canvas(self.canvas)
+        elif layout is not None and self.button in (1, 2):
+            # Keep the layout up to date with where this (and its followers) moved
+            layout.moved([annotation.ref_artist for annotation in [self] + followers])
+
+
+    def disconnect(self):
+        """Stop receiving mouse events from the canvas dispatcher."""
+        if self._motion_timer is not None:
+            self._motion_timer.stop()
+        get_dispatcher(self.canvas).unregister(self)
         
         
     def print_annotation(self):
@@ -169,12 +460,45 @@ class DraggableAnnotationLine2D(matplotlib.offsetbox.DraggableBase):
     def remove(self):
         """Disconnect and delete the annotation."""
         #print('Remove',self.id)
+        canvas=self.canvas # Keep the canvas, the artist is about to lose it
         self.disconnect() # Disconnect the callbacks
-        self.ref_artist.remove() # Delete the annotation artist
+        if self._use_blit and self.got_artist and self.background is not None:
+            # We are being dragged. start_drag() already saved a background
+            # without this annotation, so just put it back.
+            fig=self.ref_artist.get_figure()
+            self.ref_artist.remove() # Delete the annotation artist
+            canvas.restore_region(self.background)
+            _blit_canvas(canvas, fig.bbox)
+        elif self._use_blit:
+            # Restore only the region under the annotation (full draw if we can't)
+            get_blit_manager(canvas).remove(self.ref_artist)
+        else:
+            self.ref_artist.remove() # Delete the annotation artist
+            _draw_canvas(canvas) # Update the whole canvas so the annotation disappears
         self.got_artist=False # Tell this class it no longer has an artist
-        self.canvas.draw() # Update the whole canvas so the annotation disappears
         
         
+class AnnotationCollection(list):
+    """
+    A list of DraggableAnnotationLine2D instances, as returned by
+    AnnotationPicker.annotate_many(). Use remove_all() to delete them all with
+    a single redraw. (list.remove() still removes one item from the list.)
+    """
+    def remove_all(self):
+        """Disconnect and delete every annotation in the collection."""
+        canvases=set()
+        for annotation in self:
+            if annotation.ref_artist.get_figure() is None:
+                continue # Already removed
+            canvases.add(annotation.canvas)
+            annotation.disconnect()
+            annotation.ref_artist.remove()
+            annotation.got_artist=False
+        del self[:]
+        for canvas in canvases:
+            _draw_canvas(canvas)
+
+
 class AnnotationPicker(object):
     """
     A class to enable convenient annotations to any plot.
@@ -186,22 +510,49 @@ class AnnotationPicker(object):
         artists: (default None) A single or list of artists to attach this to as 'artist annotations'
         tolerance : (default 5) Picker tolerance to a line's data point to create an annotation.
         formatter : function to generate the string in the annotation. fcn(Line2D artist, index)
+            Use get_point(line, index) for the data at the index. If a full
+            resolution source is attached to the line (see attach_source),
+            index is a source index, so line.get_xydata()[index] is wrong.
+        vectorized : (default False) The formatter takes a sequence of indices
+            and returns a list of strings. fcn(Line2D artist, indices)
+        spatial_pick : (default False) Use a cached spatial index per axes to find
+            the nearest line and data point, instead of letting matplotlib
+            test every vertex of every line on each click. Only data points
+            (not the segments between them) can be picked.
+        use_blit : (default True) Blit annotations when they are dragged, created
+            or removed, instead of redrawing the whole canvas.
+        frame_rate : (default None) Maximum redraws per second while dragging
+            an annotation. Extra mouse motion events are merged. None redraws
+            on every motion event.
+        hover : (default False) Show a tooltip with the formatter text of the
+            nearest data point (within tolerance) while the mouse moves.
+            A single annotation artist is reused for each axes.
+        auto_layout : (default False) Choose the text offset of each new
+            annotation so its box doesn't overlap the others (see
+            AnnotationLayout). After a left-drag, the annotations under the
+            dropped one are moved instead.
         All other keyword arguments Will be passed to the annotation.
     """
     
-    def __init__(self, artists=None, tolerance=5, formatter=None, button=1, key = 'control', use_blit=True, **kwargs):
+    def __init__(self, artists=None, tolerance=5, formatter=None, button=1, key = 'control', use_blit=True, spatial_pick=False, vectorized=False, frame_rate=None, hover=False, auto_layout=False, **kwargs):
         # Parse the arguments
         self.tolerance = tolerance
+        self.auto_layout = auto_layout
+        self.hover = hover
+        self.frame_rate = frame_rate
+        self.spatial_pick = spatial_pick
         self.use_blit = use_blit
         self.button = button
         self.key=key
         if formatter is None: # Use default
             self.formatter=self._annotate_line_str
+            self.vectorized=False
         else:
             self.formatter = formatter
+            self.vectorized = vectorized
         # Save the annotation parameters
         self.annotation_kwargs = dict(xycoords='data', textcoords='offset points',
-            fontsize=11, picker=True, xytext=(20, 20),
+            fontsize=11, xytext=(20, 20),
             bbox=dict(boxstyle='round,pad=0.5', fc='yellow', alpha=0.5),
             arrowprops=dict(shrink=0.05, headwidth=5, width=1))
         # Add in additional/modified user parameters
@@ -236,12 +587,67 @@ class AnnotationPicker(object):
             else:
                 lines=[]
             for line in lines:
-                line.set_picker(self.tolerance)
+                self._enable_picker(line)
                 
         # Make sure the callbacks are enabled for the parent canvas
         enable_callbacks(artist)
         
         
+    def _enable_picker(self, line):
+        """Enable picking on the line using either the tolerance or the spatial index."""
+        if self.spatial_pick:
+            line.set_picker(self._spatial_picker)
+        else:
+            line.set_picker(self.tolerance)
+        
+        
+    def _spatial_picker(self, line, mouseevent):
+        """
+        Custom Line2D picker used when spatial_pick is enabled.
+        The axes index is queried once per mouse event, and only the nearest
+        line reports a hit, with the single nearest index.
+        """
+        # Don't bother searching if this click can't create an annotation.
+        if mouseevent.button != self.button or mouseevent.key != self.key:
+            return (False, {})
+        # Same units as the Line2D pick radius (points)
+        radius = self.tolerance * line.get_figure().dpi / 72.
+        found = get_pick_index(line.axes).query(mouseevent, radius)
+        if found is not None and found[0] is line:
+            return (True, dict(ind=[found[1]]))
+        return (False, {})
+        
+        
+    def _onhover(self, event):
+        """Called by canvas motion event when hover is enabled. Updates the tooltip."""
+        ax=event.inaxes
+        radius = self.tolerance * ax.get_figure().dpi / 72.
+        found = get_pick_index(ax).query(event, radius)
+        tooltip = getattr(ax, tooltip_attr_name, None)
+        if found is None:
+            if tooltip is not None and tooltip.get_visible():
+                tooltip.set_visible(False)
+                get_blit_manager(event.canvas).update_overlay(tooltip)
+            return
+        line, index = found
+        line_index = get_line_index(line)
+        index = line_index.to_source(index, (event.x, event.y), ax, radius)
+        text = self.format_text(line, index)
+        xy = line_index.point(index)
+        if tooltip is None:
+            # Created once per axes, then reused for every point
+            tooltip = ax.annotate(text, xy, **self.annotation_kwargs)
+            setattr(ax, tooltip_attr_name, tooltip)
+            get_blit_manager(event.canvas).add_overlay(tooltip)
+        elif tooltip.get_visible() and tooltip.get_text() == text and \
+            tuple(tooltip.xy) == tuple(xy):
+            return # Same point. Nothing to draw.
+        tooltip.xy = xy
+        tooltip.set_text(text)
+        tooltip.set_visible(True)
+        get_blit_manager(event.canvas).update_overlay(tooltip)
+        
+        
     def annotate(self, line, index, text=None):
         """
         Makes a draggable, interactive annotation on the given line,
@@ -252,16 +658,121 @@ class AnnotationPicker(object):
         Returns a DraggableAnnotationLine2D instance where the annotation artist is in self.ref_artist.
         """        
         if text is None:
-            # Get the text from the formatter
-            formatter=self.formatter
+            # Get the text from the formatter (through the text cache)
+            formatter=self.format_text
         else:
             # Manual text is given. Don't use the formatter
             formatter = None
         # Create the annotation at the designated point
-        ax=line.get_axes()
-        annot=ax.annotate(text, line.get_xydata()[index,:], **self.annotation_kwargs)
+        ax=line.axes
+        annot=ax.annotate(text, get_line_index(line).point(index), **self.annotation_kwargs)
+        if self.auto_layout:
+            # The layout needs the size of the text
+            if formatter is not None:
+                annot.set_text(formatter(line, index))
+            get_layout(line.get_figure().canvas).place(annot)
         # Make it draggable using our class, then return the object
-        return DraggableAnnotationLine2D(annot, line, index, formatter, use_blit=self.use_blit)
+        return DraggableAnnotationLine2D(annot, line, index, formatter,
+            use_blit=self.use_blit, frame_rate=self.frame_rate, auto_layout=self.auto_layout)
+        
+        
+    def annotate_many(self, line, indices, texts=None, offsets=None, draw=True):
+        """
+        Makes many draggable, interactive annotations on the given line, and
+        only updates the canvas once at the end.
+        line : Line2D object to annotate
+        indices : Sequence or array of line indices to annotate
+        texts : Sequence of texts, one per index. If None, then use default.
+            None entries in the sequence also use the default.
+        offsets : Sequence of (x, y) text offsets in points, one per index.
+            If None, then use the 'xytext' annotation parameter (or the
+            automatic layout, if enabled).
+        draw : If False, don't update the canvas. The caller will.
+        Returns an AnnotationCollection of DraggableAnnotationLine2D instances.
+        """
+        indices=np.asarray(indices, dtype=int).ravel()
+        # Fetch all of the coordinates at once
+        xy=get_line_index(line).points(indices)
+        if texts is None:
+            texts=[None]*len(indices)
+        # Only the annotations without custom text use the formatter
+        texts=list(texts)
+        default=[i for i, text in enumerate(texts) if text is None]
+        for i, text in zip(default, self.format_texts(line, indices[default])):
+            texts[i]=text
+        formatters=[None]*len(indices)
+        for i in default:
+            formatters[i]=self.format_text
+        # Given offsets win over the automatic layout
+        layout = get_layout(line.get_figure().canvas) if self.auto_layout and offsets is None else None
+        if offsets is None:
+            offsets=[self.annotation_kwargs['xytext']]*len(indices)
+        kwargs=dict(self.annotation_kwargs)
+        ax=line.axes
+        annotations=AnnotationCollection()
+        for index, point, text, formatter, offset in zip(indices.tolist(), xy, texts, formatters, offsets):
+            kwargs['xytext']=tuple(offset)
+            annot=ax.annotate(text, point, **kwargs)
+            if layout is not None:
+                layout.place(annot)
+            annotations.append(DraggableAnnotationLine2D(annot, line, index,
+                formatter, use_blit=self.use_blit, draw=False, frame_rate=self.frame_rate,
+                auto_layout=self.auto_layout))
+        # One update for the whole batch
+        if not draw:
+            pass
+        elif annotations and self.use_blit:
+            get_blit_manager(line.get_figure().canvas).draw_many([a.ref_artist for a in annotations])
+        elif annotations:
+            _draw_canvas(line.get_figure().canvas)
+        return annotations
+        
+        
+    def format_text(self, line, index):
+        """
+        Returns the formatter text for this line and index.
+        Text is cached on the line (see LineIndex.texts), so sliding back and
+        forth over the same points never formats the same text twice.
+        """
+        texts=get_line_index(line).texts
+        key=(self.formatter, index)
+        text=texts.get(key)
+        if text is None:
+            if self.vectorized:
+                text=_timed('formatter', self.formatter, line, [index])[0]
+            else:
+                text=_timed('formatter', self.formatter, line, index)
+            texts[key]=text
+            if len(texts) > text_cache_size:
+                texts.popitem(last=False) # Drop the least recently used
+        else:
+            texts.move_to_end(key)
+        return text
+        
+        
+    def format_texts(self, line, indices):
+        """
+        Returns a list of formatter texts for this line and a sequence of indices.
+        A vectorized formatter is called once for all indices that aren't cached.
+        """
+        indices=np.asarray(indices, dtype=int).ravel().tolist()
+        if not self.vectorized:
+            return [self.format_text(line, index) for index in indices]
+        texts=get_line_index(line).texts
+        missing=[index for index in indices if (self.formatter, index) not in texts]
+        new_texts=dict(zip(missing, _timed('formatter', self.formatter, line, missing))) if missing else {}
+        result=[]
+        for index in indices:
+            key=(self.formatter, index)
+            if index in new_texts:
+                text=new_texts[index]
+            else:
+                text=texts.pop(key) # Re-inserted below as most recently used
+            texts[key]=text
+            result.append(text)
+        while len(texts) > text_cache_size:
+            texts.popitem(last=False)
+        return result
         
         
     def _annotate_line_str(self, line, index):
@@ -269,23 +780,1107 @@ class AnnotationPicker(object):
         The default function to take a Line2D artist and index and generate a
         string for the annotation box.
         """
-        xy=line.get_xydata()[index]
+        # Lines with a full resolution source report the source sample
+        xy=get_line_index(line).point(index)
         return '{0}[{1}]:\nx={2:.9}\ny:{3:.9}'.format(line.get_label(),index,xy[0],xy[1])
         
         
+    @_instrumented('onpick')
     def _onpick(self,event):
         """Called by canvas pick event."""
         if event.mouseevent.button == self.button and \
             event.mouseevent.key == self.key and \
             isinstance(event.artist, matplotlib.lines.Line2D):
             # More than one index may be in range. Determine the middle index.
+            # (The spatial picker only ever gives the nearest index.)
             ind = event.ind[len(event.ind)//2]
             global _event
             _event=event
+            # Lines with a full resolution source are annotated at the nearest source sample.
+            radius = self.tolerance * event.artist.get_figure().dpi / 72.
+            ind = get_line_index(event.artist).to_source(ind,
+                (event.mouseevent.x, event.mouseevent.y), event.artist.axes, radius)
             # Generate the annotation
             self.annotate(event.artist, ind)
         
         
+class AnnotationDispatcher(object):
+    """
+    Routes mouse events on a canvas to the annotations on it.
+    One instance is kept per canvas (see get_dispatcher), so each mouse event
+    costs one callback instead of one per annotation.
+    On button-down, a grid of annotation boxes (in display coordinates) gives
+    the annotations under the cursor. They are tested topmost first, and the
+    first hit gets the motion and release events until the button is released.
+    The grid is rebuilt after a view change. Otherwise only the annotations
+    that were added or moved (see moved) are measured again.
+    """
+    cell=64 # Grid cell size in pixels
+
+    def __init__(self, canvas):
+        self.canvas=canvas
+        self.annotations=set()
+        self.active=None # The annotation being dragged
+        self._grid=None # {(column, row): [annotations]}, rebuilt when needed
+        self._cells={} # {annotation: [(column, row), ...]} where it is in the grid
+        self._pending=set() # Annotations to measure and add to the grid
+        self._key=None # The views the grid was built in
+        self.cids=[canvas.mpl_connect('button_press_event', self.on_press),
+                   canvas.mpl_connect('motion_notify_event', self.on_motion),
+                   canvas.mpl_connect('button_release_event', self.on_release),
+                   canvas.mpl_connect('draw_event', self._on_draw)]
+
+
+    def register(self, annotation):
+        """Start routing mouse events to this annotation."""
+        self.annotations.add(annotation)
+        self._pending.add(annotation)
+
+
+    def unregister(self, annotation):
+        """Stop routing mouse events to this annotation."""
+        self.annotations.discard(annotation)
+        if self.active is annotation:
+            self.active=None
+        self._discard(annotation)
+
+
+    def moved(self, annotation):
+        """The annotation has moved. Measure it again on the next click."""
+        self._discard(annotation)
+        if annotation in self.annotations:
+            self._pending.add(annotation)
+
+
+    def _on_draw(self, event):
+        """After a full draw, drop annotations whose line or axes was removed."""
+        get_registry().collect(self.canvas)
+
+
+    def invalidate(self, event=None):
+        """Annotations may have moved (view change or new data). Rebuild the grid on the next click."""
+        self._grid=None
+        self._cells={}
+
+
+    def _discard(self, annotation):
+        self._pending.discard(annotation)
+        for cell in self._cells.pop(annotation, ()):
+            self._grid[cell].remove(annotation)
+
+
+    def _insert(self, annotation, bbox):
+        cell=self.cell
+        cells=[(column, row) for column in range(int(bbox.x0 // cell), int(bbox.x1 // cell) + 1)
+                             for row in range(int(bbox.y0 // cell), int(bbox.y1 // cell) + 1)]
+        for key in cells:
+            self._grid.setdefault(key, []).append(annotation)
+        self._cells[annotation]=cells
+
+
+    def _build_grid(self):
+        renderer=self.canvas.get_renderer()
+        self._grid={}
+        self._cells={}
+        self._pending=set()
+        self._key=_figure_view_key(self.canvas.figure)
+        for annotation in self.annotations:
+            artist=annotation.ref_artist
+            if artist.get_figure() is None or not artist.get_visible():
+                continue
+            # Laid out by the last draw
+            self._insert(annotation, artist.get_bbox_patch().get_window_extent(renderer))
+
+
+    def _update_grid(self):
+        """Add the new or moved annotations to the grid (or rebuild it after a view change)."""
+        if self._grid is None or self._key != _figure_view_key(self.canvas.figure):
+            self._build_grid()
+            return
+        renderer=self.canvas.get_renderer()
+        for annotation in self._pending:
+            artist=annotation.ref_artist
+            if artist.get_figure() is not None and artist.get_visible():
+                # Maybe never drawn, so lay it out first
+                self._insert(annotation, _text_box(artist, renderer))
+        self._pending=set()
+
+
+    def hit_test(self, event):
+        """Returns the topmost annotation that wants this mouse event, or None."""
+        self._update_grid()
+        candidates=self._grid.get((int(event.x // self.cell), int(event.y // self.cell)), [])
+        for annotation in sorted(candidates, key=_annotation_zorder, reverse=True):
+            if annotation.artist_picker(annotation.ref_artist, event)[0]:
+                return annotation
+        return None
+
+
+    def on_press(self, event):
+        """Button-down: choose which annotation (if any) is dragged."""
+        if self.active is not None:
+            return # Already dragging. Only one annotation at a time on this canvas.
+        annotation=self.hit_test(event)
+        if annotation is not None:
+            self.active=annotation
+            annotation.start_drag(event)
+
+
+    def on_motion(self, event):
+        if self.active is not None:
+            self.active.on_motion(event)
+
+
+    def on_release(self, event):
+        annotation=self.active
+        if annotation is None:
+            return
+        self.active=None
+        followers=annotation._followers
+        annotation.on_release(event)
+        # It (and any linked followers) may have moved or been removed
+        for moved in [annotation] + followers:
+            self.moved(moved)
+
+
+class _AnnotationRecord(object):
+    """Weak references to an annotation and what it depends on."""
+    __slots__ = ('annotation', 'line', 'axes', 'canvas')
+
+    def __init__(self, annotation, callback):
+        self.annotation=weakref.ref(annotation, callback)
+        line=annotation.line
+        self.line=None if line is None else weakref.ref(line)
+        self.axes=weakref.ref(annotation.ref_artist.axes)
+        self.canvas=weakref.ref(annotation.canvas)
+
+
+class AnnotationRegistry(object):
+    """
+    Keeps track of every DraggableAnnotationLine2D using weak references.
+    One instance is kept for the module (see get_registry).
+    collect() disconnects and removes annotations whose line or axes was
+    removed. It runs after every full draw of a canvas. report() counts the
+    live objects and the memory cached for them.
+    """
+    def __init__(self):
+        self._records={} # {annotation.id: _AnnotationRecord}
+
+
+    def add(self, annotation):
+        """Track this annotation. The record goes away when the annotation does."""
+        key=annotation.id
+        self._records[key]=_AnnotationRecord(annotation,
+            lambda ref, records=self._records, key=key: records.pop(key, None))
+
+
+    def annotations(self, canvas=None):
+        """Returns a list of the live annotations (on the given canvas, or all)."""
+        annotations=[]
+        for record in list(self._records.values()):
+            annotation=record.annotation()
+            if annotation is not None and (canvas is None or record.canvas() is canvas):
+                annotations.append(annotation)
+        return annotations
+
+
+    def collect(self, canvas=None):
+        """
+        Disconnect and remove every annotation (on the given canvas, or all)
+        whose line or axes is gone, or whose artist was removed.
+        Returns the number of annotations dropped.
+        """
+        axes_lines={} # Set of lines for each axes, built once per axes
+        redraw=set()
+        dropped=0
+        for key, record in list(self._records.items()):
+            annotation=record.annotation()
+            record_canvas=record.canvas()
+            if annotation is None or record_canvas is None:
+                self._records.pop(key, None)
+                continue
+            if canvas is not None and record_canvas is not canvas:
+                continue
+            ax=record.axes()
+            fig=record_canvas.figure
+            if annotation.ref_artist.get_figure() is None:
+                gone=True # The annotation itself was removed
+            elif ax is None or ax not in fig.get_axes():
+                gone=True # The axes was removed
+            elif record.line is not None:
+                line=record.line()
+                if ax not in axes_lines:
+                    axes_lines[ax]=set(ax.get_lines())
+                gone = line is None or line not in axes_lines[ax]
+            else:
+                gone=False
+            if gone:
+                get_dispatcher(record_canvas).unregister(annotation)
+                if annotation.ref_artist.get_figure() is not None:
+                    annotation.ref_artist.remove()
+                    redraw.add(record_canvas)
+                self._records.pop(key, None)
+                dropped += 1
+        for record_canvas in redraw:
+            record_canvas.draw_idle()
+        return dropped
+
+
+    def report(self):
+        """
+        Returns a dict of live object counts for the tracked annotations:
+        annotations, lines, axes and canvases, plus the bytes of line data and
+        of the cached LineIndex arrays, and the number of cached texts.
+        """
+        annotations, lines, axes, canvases = 0, set(), set(), set()
+        for record in list(self._records.values()):
+            if record.annotation() is None:
+                continue
+            annotations += 1
+            for ref, found in ((record.line, lines), (record.axes, axes), (record.canvas, canvases)):
+                obj=None if ref is None else ref()
+                if obj is not None:
+                    found.add(obj)
+        data_bytes, index_bytes, texts = 0, 0, 0
+        for line in lines:
+            data_bytes += line.get_xydata().nbytes
+            line_index=getattr(line, index_attr_name, None)
+            if line_index is not None:
+                index_bytes += line_index.nbytes()
+                texts += len(line_index.texts)
+        return dict(annotations=annotations, lines=len(lines), axes=len(axes),
+                    canvases=len(canvases), line_data_bytes=data_bytes,
+                    line_index_bytes=index_bytes, cached_texts=texts)
+
+
+class BlitManager(object):
+    """
+    Draws and erases annotations on a canvas without re-rendering the figure.
+    One instance is kept per canvas (see get_blit_manager).
+    The view of each axes is recorded on every full draw. If an axes has
+    been zoomed, panned or resized since then, we fall back to a full draw.
+    Overlays (hover tooltips) are animated artists that stay on top. They are
+    not part of the figure, so they are drawn over a saved background.
+    """
+    def __init__(self, canvas):
+        self.canvas=canvas
+        self._keys={} # _view_key of each axes at the last full draw
+        self._figure_bounds=None
+        # Pixels under each blitted artist, in drawing order: [artist, region, patch]
+        self._patches=[]
+        self.overlays=[]
+        self._overlay_regions=[] # Where the overlays are drawn right now
+        self.background=None # The canvas without overlays (None when out of date)
+        self.cid=canvas.mpl_connect('draw_event', self._on_draw)
+
+
+    def _on_draw(self, event):
+        """Record the view of every axes after a full draw."""
+        fig=self.canvas.figure
+        self._figure_bounds=tuple(fig.bbox.bounds)
+        self._keys=dict((ax, _view_key(ax)) for ax in fig.get_axes())
+        # The full draw painted over any saved regions.
+        self._patches=[]
+        # Overlays are animated, so the full draw skipped them. Put them back.
+        self.background=None
+        self._overlay_regions=[]
+        self._draw_overlays()
+
+
+    def valid(self, ax):
+        """True if the canvas still shows the axes exactly as it was last drawn."""
+        return self._figure_bounds == tuple(self.canvas.figure.bbox.bounds) and \
+            ax in self._keys and self._keys[ax] == _view_key(ax)
+
+
+    def add_overlay(self, artist):
+        """Keep this (animated) artist on top of the canvas while it is visible."""
+        artist.set_animated(True)
+        self.overlays.append(artist)
+
+
+    def hide_overlays(self):
+        """Hide all overlays (before a drag saves its own background)."""
+        for artist in self.overlays:
+            artist.set_visible(False)
+
+
+    def update_overlay(self, artist):
+        """Redraw the overlays after this one has changed, blitting only what moved."""
+        if not self.valid(artist.axes):
+            _draw_canvas(self.canvas)
+            return
+        regions=self._erase_overlays()
+        regions += self._draw_overlays()
+        if regions:
+            _blit_canvas(self.canvas, matplotlib.transforms.Bbox.union(regions))
+
+
+    def _erase_overlays(self):
+        """Restore the background under the overlays. Returns the erased regions."""
+        regions=self._overlay_regions
+        if regions:
+            self.canvas.restore_region(self.background)
+        self._overlay_regions=[]
+        return regions
+
+
+    def _draw_overlays(self):
+        """Draw the visible overlays on top. Returns the regions they cover."""
+        visible=[artist for artist in self.overlays
+                 if artist.get_visible() and artist.get_figure() is not None]
+        if not visible:
+            return []
+        if self.background is None:
+            # The canvas has no overlays on it right now, so save it as is.
+            self.background=self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        for artist in visible:
+            artist.axes.draw_artist(artist)
+        self._overlay_regions=[region for region in
+            (_artist_region(artist, self.canvas) for artist in visible) if region is not None]
+        return list(self._overlay_regions)
+
+
+    def draw(self, artist):
+        """Draw a new artist on top of the canvas and blit only its region."""
+        ax=artist.axes
+        if not self.valid(ax):
+            _draw_canvas(self.canvas)
+            return
+        region=_artist_region(artist, self.canvas)
+        if region is None:
+            return # Nothing to see
+        self._erase_overlays()
+        # Save what is underneath so that remove() can put it back.
+        self._patches.append([artist, region, self.canvas.copy_from_bbox(region)])
+        ax.draw_artist(artist)
+        self.background=None
+        _blit_canvas(self.canvas, matplotlib.transforms.Bbox.union([region] + self._draw_overlays()))
+
+
+    def draw_many(self, artists):
+        """
+        Draw many new artists on top of the canvas with a single blit.
+        Their regions are not saved, so removing one later means a full draw.
+        """
+        axes=set(artist.axes for artist in artists)
+        if not all(self.valid(ax) for ax in axes):
+            _draw_canvas(self.canvas)
+            return
+        self._erase_overlays()
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+        self.background=None
+        self._draw_overlays()
+        _blit_canvas(self.canvas, self.canvas.figure.bbox)
+
+
+    def remove(self, artist):
+        """Remove the artist from the figure and erase it from the canvas."""
+        ax=artist.axes
+        region=_artist_region(artist, self.canvas) if self.valid(ax) else None
+        patch=None
+        for i, (other, other_region, other_patch) in enumerate(self._patches):
+            if other is artist:
+                # The saved pixels are only good if the artist hasn't moved and
+                # nothing drawn after it overlaps.
+                later=[r for (a, r, p) in self._patches[i+1:]]
+                if region is not None and _bbox_inside(region, other_region) and \
+                    not any(region.overlaps(r) for r in later):
+                    patch=other_patch
+                del self._patches[i]
+                break
+        artist.remove()
+        if patch is not None:
+            self._erase_overlays()
+            self.canvas.restore_region(patch)
+            self.background=None
+            _blit_canvas(self.canvas, matplotlib.transforms.Bbox.union([other_region] + self._draw_overlays()))
+        else:
+            _draw_canvas(self.canvas)
+
+
+class AnnotationLink(object):
+    """
+    A group of annotations that slide together (see link_annotations).
+    When one of them is slid with the middle button, the others move to the
+    sample of their own line that is nearest to the same x value (a binary
+    search per line, see LineIndex.nearest_x). The linked annotations on the
+    same canvas are redrawn with the slid one, in a single blit.
+    Annotations are weakly referenced, so a link never keeps one alive.
+    """
+    def __init__(self, annotations=()):
+        self.annotations=weakref.WeakSet()
+        for annotation in annotations:
+            self.add(annotation)
+
+
+    def add(self, annotation):
+        """Add the annotation to this link (and remove it from its previous one)."""
+        if annotation.link is not None and annotation.link is not self:
+            annotation.link.discard(annotation)
+        annotation.link=self
+        self.annotations.add(annotation)
+
+
+    def discard(self, annotation):
+        """Remove the annotation from this link."""
+        self.annotations.discard(annotation)
+        if annotation.link is self:
+            annotation.link=None
+
+
+    def follow(self, leader, x):
+        """
+        Move every annotation of the link, except leader, to x.
+        Returns the list of annotations that moved.
+        """
+        moved=[]
+        for annotation in list(self.annotations):
+            line=annotation.line
+            if annotation is leader or line is None or annotation.ref_artist.get_figure() is None:
+                continue
+            line_index=get_line_index(line)
+            index=line_index.nearest_x(x)
+            if index == annotation.index:
+                continue
+            annotation.ref_artist.xy=line_index.point(index)
+            annotation.index=index
+            if annotation.formatter is not None:
+                annotation.ref_artist.set_text(annotation.formatter(line, index))
+            moved.append(annotation)
+        return moved
+
+
+class AnnotationLayout(object):
+    """
+    Chooses annotation text offsets so that the text boxes don't overlap.
+    One instance is kept per canvas (see get_layout).
+    The display boxes of the annotations are kept in a spatial hash (grid
+    cells of self.cell pixels), so placing one annotation only tests the
+    boxes near its candidate positions, and placing many is near-linear.
+    Candidates are tried in rings around the data point, nearest first. The
+    first one that overlaps no other box and stays inside the axes wins.
+    Only the annotation being placed is moved. The hash is rebuilt when the
+    view changes, when annotations were added or removed without it, or after
+    invalidate(). Annotations moved by the user are updated with moved().
+    """
+    cell=64 # Grid cell size in pixels
+    gap=20 # Distance between rings of candidates, in points
+    rings=6
+    directions=((1, 1), (-1, 1), (1, -1), (-1, -1), (0, 1), (1, 0), (0, -1), (-1, 0))
+
+    def __init__(self, canvas):
+        self.canvas=canvas
+        self._boxes={} # {annotation artist: (x0, y0, x1, y1)} in display coordinates
+        self._grid={} # {(column, row): set of annotation artists}
+        self._key=None # The views the boxes were measured in
+
+
+    def _cells(self, box):
+        cell=self.cell
+        for column in range(int(box[0] // cell), int(box[2] // cell) + 1):
+            for row in range(int(box[1] // cell), int(box[3] // cell) + 1):
+                yield (column, row)
+
+
+    def _insert(self, artist, box):
+        self._boxes[artist]=box
+        for cell in self._cells(box):
+            self._grid.setdefault(cell, set()).add(artist)
+
+
+    def _discard(self, artist):
+        box=self._boxes.pop(artist, None)
+        if box is not None:
+            for cell in self._cells(box):
+                self._grid[cell].discard(artist)
+
+
+    def overlapping(self, box, exclude=None):
+        """Returns the set of annotation artists whose box overlaps box (x0, y0, x1, y1)."""
+        found=set()
+        for cell in self._cells(box):
+            for artist in self._grid.get(cell, ()):
+                other=self._boxes[artist]
+                if artist is not exclude and other[0] < box[2] and box[0] < other[2] \
+                    and other[1] < box[3] and box[1] < other[3]:
+                    found.add(artist)
+        return found
+
+
+    def moved(self, artists):
+        """Measure these annotation artists again (they were dragged or slid)."""
+        self._sync()
+        renderer=self.canvas.get_renderer()
+        for artist in artists:
+            self._discard(artist)
+            if artist.get_figure() is not None:
+                self._insert(artist, tuple(_text_box(artist, renderer).extents))
+
+
+    def invalidate(self):
+        """Annotations moved (new data). Measure them all again before the next placement."""
+        self._key=None
+
+
+    def _sync(self):
+        """Rebuild the hash if the view changed, or annotations came or went."""
+        fig=self.canvas.figure
+        key=_figure_view_key(fig)
+        annotations=get_dispatcher(self.canvas).annotations
+        if key == self._key and len(annotations) == len(self._boxes):
+            return
+        self._key=key
+        self._boxes={}
+        self._grid={}
+        renderer=self.canvas.get_renderer()
+        for annotation in annotations:
+            artist=annotation.ref_artist
+            if artist.get_figure() is not None:
+                self._insert(artist, tuple(_text_box(artist, renderer).extents))
+
+
+    def _move(self, artist, box):
+        """Move the artist to the best candidate offset. Returns its new box."""
+        px=self.canvas.figure.dpi / 72.
+        ax=artist.axes
+        point=ax.transData.transform(artist.xy)
+        position=artist.get_position()
+        # Where the box corner would be with a zero offset
+        corner=(box.x0 - position[0]*px, box.y0 - position[1]*px)
+        width, height = box.width, box.height
+        inside=ax.bbox
+        best=None
+        for ring in range(1, self.rings + 1):
+            gap=ring*self.gap*px
+            for sx, sy in self.directions:
+                x0=point[0] + (gap if sx > 0 else -gap - width if sx < 0 else -width/2.)
+                y0=point[1] + (gap if sy > 0 else -gap - height if sy < 0 else -height/2.)
+                candidate=(x0, y0, x0 + width, y0 + height)
+                cost=len(self.overlapping(candidate, artist))
+                if x0 < inside.x0 or y0 < inside.y0 or candidate[2] > inside.x1 or candidate[3] > inside.y1:
+                    cost += 0.5 # Better outside the axes than on top of another box
+                if best is None or cost < best[0]:
+                    best=(cost, candidate)
+                if cost == 0:
+                    break
+            if best[0] == 0:
+                break
+        candidate=best[1]
+        artist.set_position(((candidate[0] - corner[0]) / px, (candidate[1] - corner[1]) / px))
+        return candidate
+
+
+    def place(self, artist, fixed=False):
+        """
+        Lay out one annotation artist (text in offset points from its data point).
+        fixed=False: move it to the nearest free position around its data point.
+        fixed=True: keep it where it is (the user dropped it there) and move
+            the annotations it overlaps instead.
+        Returns the list of the other annotation artists that were moved.
+        """
+        self._sync()
+        self._discard(artist)
+        renderer=self.canvas.get_renderer()
+        box=_text_box(artist, renderer)
+        if not fixed:
+            self._insert(artist, self._move(artist, box))
+            return []
+        self._insert(artist, tuple(box.extents))
+        moved=list(self.overlapping(self._boxes[artist], artist))
+        for other in moved:
+            self._discard(other)
+            self._insert(other, self._move(other, _text_box(other, renderer)))
+        return moved
+
+
+class LineIndex(object):
+    """
+    Cached lookups into the data of a single Line2D artist.
+    The cache is stored on the line itself (see get_line_index) and is rebuilt
+    whenever line.set_data() changes the data.
+    If x is sorted (non-decreasing), slide() uses a binary search.
+    Otherwise, nearest_pixel() finds the closest point in display coordinates.
+    If a FullResolutionSource is attached to the line (see attach_source),
+    annotation indices, point() and slide() refer to the source instead, while
+    picking still uses the displayed data.
+    """
+    def __init__(self, line):
+        self._line=weakref.ref(line) # The index is stored on the line. Don't make a cycle.
+        self.xydata=None
+        self.source=None
+        self._pixels=None # Display coordinates of the data (non-monotonic lines)
+        self._pixels_key=None
+        self._grid=None # Display space grid for picking
+        self._grid_key=None
+        # LRU cache of annotation text: {(formatter, index): text}
+        self.texts=OrderedDict()
+        self.update()
+
+
+    def update(self):
+        """Rebuild the index if the line data has changed. Returns True if rebuilt."""
+        # Line2D creates a new xy array on every recache, so identity tells us
+        # if set_data was called since the last time.
+        line=self._line()
+        if line is None:
+            return False
+        xydata=line.get_xydata()
+        source=getattr(line, source_attr_name, None)
+        if xydata is self.xydata and source is self.source:
+            return False
+        self.xydata=xydata
+        self.source=source
+        self.x=xydata[:,0] # This is a view, not a copy
+        # NaN fails the comparison, so lines with gaps use the pixel search.
+        # A source must be sorted (it is far too big to check).
+        self.monotonic = source is not None or bool(np.all(self.x[1:] >= self.x[:-1]))
+        self._pixels=None
+        self._pixels_key=None
+        self._grid_key=None
+        self.texts.clear() # Old text doesn't match the new data
+        return True
+
+
+    def nbytes(self):
+        """Bytes of the arrays cached by the index (not counting the line data)."""
+        arrays=[self._pixels] + list((self._grid or ())[:2])
+        return sum(array.nbytes for array in arrays if array is not None)
+
+
+    def slide(self, index, x):
+        """
+        Move index to follow the x data coordinate. Requires monotonic x data.
+        The index only changes once x reaches or passes a neighboring point,
+        which is exactly how the original linear walk behaved.
+        """
+        searchsorted = self.x.searchsorted if self.source is None else self.source.searchsorted
+        # Number of points <= x. Moving left stops here.
+        left = int(searchsorted(x, side='right'))
+        # Last point < x. Moving right stops here.
+        right = int(searchsorted(x, side='left')) - 1
+        if index > left:
+            return left
+        elif index < right:
+            return right
+        return index
+
+
+    def point(self, index):
+        """Returns the (x, y) data of an annotation index."""
+        if self.source is not None:
+            return self.source.points([index])[0]
+        return self.xydata[index,:]
+
+
+    def points(self, indices):
+        """Returns an (N, 2) array of the data at the annotation indices."""
+        if self.source is not None:
+            return self.source.points(indices)
+        return self.xydata[indices]
+
+
+    def nearest_x(self, x):
+        """
+        Returns the annotation index nearest to x. This is a binary search
+        if x is sorted, otherwise a scan of the whole line.
+        """
+        if self.source is not None:
+            return self.source.nearest_x(x)
+        if not self.monotonic:
+            return int(np.nanargmin(np.abs(self.x - x)))
+        index=min(int(self.x.searchsorted(x)), len(self.x) - 1)
+        if index > 0 and abs(self.x[index-1] - x) <= abs(self.x[index] - x):
+            index -= 1
+        return index
+
+
+    def to_source(self, index, xy_pixels, ax, radius):
+        """
+        Convert an index of the displayed data (from a pick) to an annotation index.
+        Without a source, this is the same index. With a source, this is the
+        source sample nearest to xy_pixels (display coordinates), or the one
+        nearest in x to the displayed point if none is within radius.
+        """
+        if self.source is None:
+            return index
+        found=self.source.nearest(ax, xy_pixels, radius)
+        if found is None:
+            found=self.source.nearest_x(self.xydata[index,0])
+        return found
+
+
+    def pixels(self, ax):
+        """Returns the line data in display coordinates, cached until the view changes."""
+        key=_view_key(ax)
+        if self._pixels is None or key != self._pixels_key:
+            self._pixels=ax.transData.transform(self.xydata)
+            self._pixels_key=key
+        return self._pixels
+
+
+    def nearest_pixel(self, xy_pixels, ax, cell=32):
+        """
+        Returns the index of the data point closest to xy_pixels (display coordinates).
+        The display grid is searched in growing circles, so the cost depends on
+        the points near the cursor, not the line length. Only if no point is
+        visible do we scan the whole line.
+        """
+        radius=cell
+        limit=np.hypot(ax.bbox.width, ax.bbox.height) + np.hypot(*(np.asarray(xy_pixels) - ax.bbox.p0))
+        while radius < 2*limit:
+            found=self.query_pixels(ax, xy_pixels, radius, cell=cell)
+            if found is not None:
+                return found[0]
+            radius *= 4
+        pixels=self.pixels(ax)
+        dist=(pixels[:,0]-xy_pixels[0])**2 + (pixels[:,1]-xy_pixels[1])**2
+        # Gaps in the data (NaN) should never be chosen.
+        dist[~np.isfinite(dist)]=np.inf
+        return int(dist.argmin())
+
+
+    def _build_grid(self, ax, cell):
+        """
+        Bin the visible data points into square cells in display coordinates.
+        Points are sorted by cell, so each row of cells is a contiguous slice.
+        """
+        pixels=self.pixels(ax)
+        # Only points inside the axes (plus one cell) can be clicked.
+        x0, y0 = ax.bbox.x0 - cell, ax.bbox.y0 - cell
+        x1, y1 = ax.bbox.x1 + cell, ax.bbox.y1 + cell
+        with np.errstate(invalid='ignore'):
+            inside = (pixels[:,0] >= x0) & (pixels[:,0] <= x1) & \
+                     (pixels[:,1] >= y0) & (pixels[:,1] <= y1)
+        ind = np.flatnonzero(inside)
+        ncols = int((x1 - x0) // cell) + 1
+        keys = ((pixels[ind,1] - y0) // cell).astype(np.int64) * ncols + \
+               ((pixels[ind,0] - x0) // cell).astype(np.int64)
+        order = keys.argsort(kind='mergesort')
+        self._grid = (keys[order], ind[order], x0, y0, ncols)
+        self._grid_key = (_view_key(ax), cell)
+
+
+    def query_pixels(self, ax, xy_pixels, radius, cell=None):
+        """
+        Find the data point closest to xy_pixels, within radius (pixels).
+        Returns (index, squared distance) or None if nothing is in range.
+        The grid (cell pixels square, default radius) is rebuilt lazily after
+        a data or view change.
+        """
+        cell = max(float(radius if cell is None else cell), 1.0)
+        if self._grid_key != (_view_key(ax), cell):
+            self._build_grid(ax, cell)
+        keys, ind, x0, y0, ncols = self._grid
+        # Range of cells touched by the circle around the cursor
+        cx0 = max(int((xy_pixels[0] - radius - x0) // cell), 0)
+        cx1 = min(int((xy_pixels[0] + radius - x0) // cell), ncols - 1)
+        cy0 = int((xy_pixels[1] - radius - y0) // cell)
+        cy1 = int((xy_pixels[1] + radius - y0) // cell)
+        if cx0 > cx1:
+            return None
+        # Each row of cells is one contiguous slice of the sorted keys
+        candidates = [ind[keys.searchsorted(cy*ncols + cx0, side='left'):
+                          keys.searchsorted(cy*ncols + cx1, side='right')]
+                      for cy in range(max(cy0, 0), cy1 + 1)]
+        candidates = np.concatenate(candidates) if candidates else ind[:0]
+        if candidates.size == 0:
+            return None
+        pixels = self.pixels(ax)[candidates]
+        dist = (pixels[:,0]-xy_pixels[0])**2 + (pixels[:,1]-xy_pixels[1])**2
+        nearest = dist.argmin()
+        if dist[nearest] > radius**2:
+            return None
+        return (int(candidates[nearest]), float(dist[nearest]))
+
+
+class FullResolutionSource(object):
+    """
+    Full resolution data behind a decimated Line2D (see attach_source).
+    x and y may be memory-mapped. Lookups use a binary search on x and only
+    read the samples near the cursor, so the data is never loaded at once.
+    x must be sorted. If x is None, x is the sample number.
+    """
+    chunk=2**20 # Samples read at a time when searching near the cursor
+
+    def __init__(self, y, x=None):
+        self.y=y
+        self.x=x
+
+
+    def __len__(self):
+        return len(self.y)
+
+
+    def searchsorted(self, value, side='left'):
+        """Like numpy searchsorted on x, without copying (or reading) all of x."""
+        if self.x is None:
+            value = np.ceil(value) if side == 'left' else np.floor(value) + 1
+            return int(min(max(value, 0), len(self.y)))
+        if side == 'left':
+            return bisect.bisect_left(self.x, value)
+        return bisect.bisect_right(self.x, value)
+
+
+    def nearest_x(self, value):
+        """Returns the index of the sample nearest to x = value."""
+        index=min(self.searchsorted(value), len(self.y) - 1)
+        if index > 0 and abs(self.points([index-1])[0,0] - value) <= abs(self.points([index])[0,0] - value):
+            index -= 1
+        return index
+
+
+    def points(self, indices):
+        """Returns an (N, 2) array of (x, y) for the given indices."""
+        indices=np.asarray(indices, dtype=int)
+        x = indices.astype(float) if self.x is None else np.asarray(self.x[indices], dtype=float)
+        return np.column_stack((x, np.asarray(self.y[indices], dtype=float)))
+
+
+    def _slice(self, start, stop):
+        x = np.arange(start, stop, dtype=float) if self.x is None else np.asarray(self.x[start:stop], dtype=float)
+        return np.column_stack((x, np.asarray(self.y[start:stop], dtype=float)))
+
+
+    def nearest(self, ax, xy_pixels, radius):
+        """
+        Returns the index of the sample nearest to xy_pixels (display
+        coordinates) within radius pixels, or None.
+        Only the samples whose x is within radius of the cursor are read.
+        """
+        inverse=ax.transData.inverted()
+        (x0, _), (x1, _) = inverse.transform([(xy_pixels[0] - radius, xy_pixels[1]),
+                                              (xy_pixels[0] + radius, xy_pixels[1])])
+        start=self.searchsorted(min(x0, x1), side='left')
+        stop=self.searchsorted(max(x0, x1), side='right')
+        best, best_dist = None, radius**2
+        for chunk_start in range(start, stop, self.chunk):
+            pixels=ax.transData.transform(self._slice(chunk_start, min(chunk_start + self.chunk, stop)))
+            dist=(pixels[:,0]-xy_pixels[0])**2 + (pixels[:,1]-xy_pixels[1])**2
+            dist[~np.isfinite(dist)]=np.inf
+            nearest=int(dist.argmin())
+            if dist[nearest] <= best_dist:
+                best, best_dist = chunk_start + nearest, dist[nearest]
+        return best
+
+
+class LineStream(object):
+    """
+    Keeps the annotations of a streaming Line2D on their samples.
+    Created by stream_line(). Each annotation is anchored to a sample key
+    instead of an index. The key is either the x value (key='x', x must be
+    sorted) or the absolute sample number (key='sample', where start is the
+    sample number of the first point of the window).
+    set_data() updates the line, then remaps every annotation with one binary
+    search over the new x (no copy of the data), and removes the annotations
+    whose sample is no longer in the window, all at once.
+    """
+    def __init__(self, line, key='x'):
+        if key not in ('x', 'sample'):
+            raise ValueError("key must be 'x' or 'sample'")
+        self._line=weakref.ref(line) # The stream is stored on the line. Don't make a cycle.
+        self.key=key
+        self.x=None # The x array from the last set_data (not a copy)
+        self.start=0
+        self._annotations=[]
+        self._keys=np.empty(0)
+        self._dirty=False # _keys must be rebuilt from the annotations
+
+
+    def _key(self, index):
+        if self.key == 'sample':
+            return self.start + index
+        x=self._line().get_xdata() if self.x is None else self.x
+        return float(x[index])
+
+
+    def add(self, annotation):
+        """Anchor the annotation to the sample at its current index."""
+        annotation.stream_key=self._key(annotation.index)
+        if annotation not in self._annotations:
+            self._annotations.append(annotation)
+        self._dirty=True
+
+
+    def set_data(self, x, y, start=None):
+        """
+        Set the line data, then move the annotations to their samples.
+        Annotations whose sample has scrolled out of the data are removed.
+        Nothing is drawn, the caller draws the new data anyway.
+        Input:
+            x, y: The new line data (as for Line2D.set_data)
+            start: The sample number of x[0] (key='sample' only)
+        Returns:
+            The number of annotations removed.
+        """
+        line=self._line()
+        line.set_data(x, y)
+        x=np.asarray(x) # No copy if it already is an array
+        y=np.asarray(y)
+        if start is not None:
+            self.start=start
+        self.x=x
+        # Forget annotations deleted by the user
+        if any(a.ref_artist.get_figure() is None for a in self._annotations):
+            self._annotations=[a for a in self._annotations if a.ref_artist.get_figure() is not None]
+            self._dirty=True
+        if self._dirty:
+            self._keys=np.array([a.stream_key for a in self._annotations], dtype=float)
+            self._dirty=False
+        if self.key == 'sample':
+            indices=(self._keys - self.start).astype(int)
+            gone=(indices < 0) | (indices >= len(x))
+        elif len(x):
+            indices=x.searchsorted(self._keys)
+            gone=(self._keys < x[0]) | (self._keys > x[-1])
+        else:
+            indices=np.zeros(len(self._keys), dtype=int)
+            gone=np.ones(len(self._keys), dtype=bool)
+        kept=[]
+        for annotation, index, retire in zip(self._annotations, indices.tolist(), gone.tolist()):
+            if retire:
+                get_dispatcher(annotation.canvas).unregister(annotation)
+                annotation.ref_artist.remove()
+                annotation.got_artist=False
+                continue
+            kept.append(annotation)
+            annotation.ref_artist.xy=(x[index], y[index])
+            if index != annotation.index:
+                annotation.index=index
+                if annotation.formatter is not None:
+                    annotation.ref_artist.set_text(annotation.formatter(line, index))
+        if kept:
+            get_dispatcher(line.get_figure().canvas).invalidate()
+            get_layout(line.get_figure().canvas).invalidate()
+        dropped=len(self._annotations) - len(kept)
+        if dropped:
+            self._annotations=kept
+            self._keys=self._keys[~gone]
+        return dropped
+
+
+class AxesPickIndex(object):
+    """
+    Nearest point lookup across all pickable lines of an axes.
+    Each line keeps its own grid (see LineIndex.query_pixels). This class
+    resolves the nearest line, and remembers the answer for the current
+    mouse event so that every line's picker doesn't repeat the search.
+    """
+    def __init__(self, ax):
+        self.ax=ax
+        self._event=None
+        self._radius=None
+        self._found=None
+
+
+    def query(self, mouseevent, radius):
+        """Returns (line, index) of the nearest pickable data point, or None."""
+        if mouseevent is self._event and radius == self._radius:
+            return self._found
+        best=None
+        xy_pixels=(mouseevent.x, mouseevent.y)
+        for line in self.ax.get_lines():
+            if not (line.pickable() and line.get_visible()):
+                continue
+            found=get_line_index(line).query_pixels(self.ax, xy_pixels, radius)
+            # Ties go to the line that is drawn last (on top)
+            if found is not None and (best is None or found[1] <= best[2]):
+                best=(line,) + found
+        self._event=mouseevent
+        self._radius=radius
+        self._found=None if best is None else best[:2]
+        return self._found
+
+
+class AnnotationSpec(object):
+    """
+    A declarative description of the annotations to put on a figure, for
+    headless rendering (see export_annotated).
+    Optional arguments:
+        lines : (default None) Which lines to annotate. None for every line,
+            a label, the line number (counting through all axes in order), a
+            function fcn(Line2D artist) returning True, or a list of these.
+        indices : Sequence of line indices to annotate.
+        rule : If indices is None, how to find them: 'argmax', 'argmin',
+            'peaks' (local maxima), or a function fcn(x, y) returning indices.
+        count : (default None) Keep only the count highest points of the rule.
+        formatter, vectorized : As for AnnotationPicker. For a process pool,
+            the formatter must be a module level function (it is pickled).
+        All other keyword arguments will be passed to the annotation.
+    """
+    def __init__(self, lines=None, indices=None, rule='argmax', count=None, formatter=None, vectorized=False, **kwargs):
+        self.lines=lines
+        self.indices=indices
+        self.rule=rule
+        self.count=count
+        self.formatter=formatter
+        self.vectorized=vectorized
+        self.annotation_kwargs=kwargs
+
+
+    def select(self, fig):
+        """Returns the list of lines of the figure this spec annotates."""
+        lines=[line for ax in fig.get_axes() for line in ax.get_lines()]
+        if self.lines is None:
+            return lines
+        selected=[]
+        for number, line in enumerate(lines):
+            for selector in _make_iterable(self.lines):
+                if callable(selector):
+                    found=selector(line)
+                elif isinstance(selector, str):
+                    found = line.get_label() == selector
+                else:
+                    found = number == selector
+                if found:
+                    selected.append(line)
+                    break
+        return selected
+
+
+    def find_indices(self, line):
+        """Returns the array of indices to annotate on this line."""
+        if self.indices is not None:
+            return np.asarray(self.indices, dtype=int).ravel()
+        x, y = line.get_xdata(), line.get_ydata()
+        y=np.asarray(y, dtype=float)
+        if callable(self.rule):
+            indices=np.asarray(self.rule(x, y), dtype=int).ravel()
+        elif self.rule == 'argmax':
+            indices=np.array([np.nanargmax(y)])
+        elif self.rule == 'argmin':
+            indices=np.array([np.nanargmin(y)])
+        elif self.rule == 'peaks':
+            indices=np.flatnonzero((y[1:-1] > y[:-2]) & (y[1:-1] >= y[2:])) + 1
+        else:
+            raise ValueError('Unknown annotation rule: {0!r}'.format(self.rule))
+        if self.count is not None and len(indices) > self.count:
+            # The highest points, still in line order
+            indices=np.sort(indices[np.argsort(-y[indices], kind='stable')[:self.count]])
+        return indices
+
+
+    def apply(self, fig):
+        """
+        Add plain (non-interactive) annotations to the figure.
+        No callbacks, pickers or draggable annotations are created.
+        Returns the list of matplotlib Annotation artists.
+        """
+        # The picker is only used for its annotation parameters and formatter.
+        picker=AnnotationPicker(formatter=self.formatter, vectorized=self.vectorized, **self.annotation_kwargs)
+        artists=[]
+        for line in self.select(fig):
+            indices=self.find_indices(line)
+            if not len(indices):
+                continue
+            ax=line.axes
+            xy=get_line_index(line).points(indices)
+            for point, text in zip(xy, picker.format_texts(line, indices)):
+                artists.append(ax.annotate(text, point, **picker.annotation_kwargs))
+        return artists
+
+
 ###########################
 # Module functions
 ###########################
@@ -307,7 +1902,10 @@ def enable_callbacks(artist):
         callbacks=[]
         callbacks.append(canvas.mpl_connect('pick_event', _on_pick_event))
         callbacks.append(canvas.mpl_connect('figure_enter_event', _on_figure_enter_event))
+        callbacks.append(canvas.mpl_connect('motion_notify_event', _on_motion_event))
         setattr(canvas, attr_name, callbacks)
+        # Start tracking full draws so that annotations can be blitted
+        get_blit_manager(canvas)
 
 
 def disable_callbacks(canvas):
@@ -345,6 +1943,313 @@ def annotate(line, index, text=None):
     annotations_instance.annotate(line, index, text)
 
 
+def annotate_many(line, indices, texts=None):
+    """
+    Wrapper function around AnnotationPicker.annotate_many()
+    This will find the controlling instance of Annotations for the given line
+    and create interactive annotations at all of the given indices.
+    Input:
+        line: The matplotlib line object to annotate (plt.figure(1).axes[0].lines[0])
+        indices: The indices of the line to annotate.
+        texts: The annotation texts, one per index. If None, then the
+            AnnotationPicker.formatter() is used.
+    Returns:
+        AnnotationCollection of DraggableAnnotationLine2D objects
+    """
+    annotations_instance = _find_annotations_instance(line)
+    if annotations_instance is None:
+        # Create a default annotation for this line
+        annotations_instance = AnnotationPicker(line)
+        setattr(line, attr_name, annotations_instance)
+    return annotations_instance.annotate_many(line, indices, texts)
+
+
+def link_annotations(annotations):
+    """
+    Link annotations (on different lines, possibly in different subplots) so
+    that sliding one with the middle button moves the others to the same x.
+    Input:
+        annotations: Sequence of DraggableAnnotationLine2D objects (for
+            example, the return values of AnnotationPicker.annotate())
+    Returns:
+        AnnotationLink object
+    """
+    return AnnotationLink(annotations)
+
+
+def save_annotations(fig, filename):
+    """
+    Save every live annotation on the figure to a compressed numpy (.npz) file,
+    one column per field. For each annotation we keep the line label and
+    position (axes number, line number), the data index, the text offset in
+    points, and the custom text (if the annotation doesn't use a formatter).
+    Use load_annotations() to recreate them on a re-plotted figure.
+    """
+    annotations=sorted((a for a in get_dispatcher(fig.canvas).annotations if a.line is not None),
+                       key=lambda a: a.id)
+    axes=fig.get_axes()
+    axes_lines=dict((ax, ax.get_lines()) for ax in axes)
+    labels, axes_numbers, line_numbers, indices, offsets, texts, custom = [], [], [], [], [], [], []
+    for annotation in annotations:
+        line=annotation.line
+        ax=line.axes
+        if ax not in axes_lines or annotation.ref_artist.get_figure() is None:
+            continue # Line or annotation is no longer on this figure
+        labels.append(line.get_label())
+        axes_numbers.append(axes.index(ax))
+        line_numbers.append(list(axes_lines[ax]).index(line))
+        indices.append(annotation.index)
+        offsets.append(annotation.ref_artist.get_position())
+        custom.append(annotation.formatter is None)
+        texts.append(annotation.ref_artist.get_text() if custom[-1] else '')
+    np.savez_compressed(filename, label=np.array(labels, dtype=str), axes=np.array(axes_numbers, dtype=int),
+        line=np.array(line_numbers, dtype=int), index=np.array(indices, dtype=int),
+        offset=np.array(offsets, dtype=float).reshape(-1, 2), text=np.array(texts, dtype=str),
+        custom=np.array(custom, dtype=bool))
+
+
+def load_annotations(fig, filename):
+    """
+    Recreate annotations saved by save_annotations() on this figure.
+    Lines are matched by label if the label is unique on the figure (and not
+    an automatic '_' label), otherwise by axes number and line number.
+    All annotations are created first, then one draw is requested with
+    draw_idle(), so this returns before thousands of annotations are rendered.
+    Returns an AnnotationCollection of DraggableAnnotationLine2D objects.
+    """
+    with np.load(filename) as data:
+        data=dict((key, data[key]) for key in data.files)
+    # Find the lines on this figure
+    positions={}
+    by_label={}
+    for axes_number, ax in enumerate(fig.get_axes()):
+        for line_number, line in enumerate(ax.get_lines()):
+            positions[(axes_number, line_number)]=line
+            by_label.setdefault(line.get_label(), []).append(line)
+    groups={}
+    for i, label in enumerate(data['label'].tolist()):
+        if not label.startswith('_') and len(by_label.get(label, [])) == 1:
+            line=by_label[label][0]
+        else:
+            line=positions.get((int(data['axes'][i]), int(data['line'][i])))
+        if line is not None:
+            groups.setdefault(line, []).append(i)
+    # One batch per line, and no drawing until the end
+    annotations=AnnotationCollection()
+    for line, rows in groups.items():
+        annotations_instance = _find_annotations_instance(line)
+        if annotations_instance is None:
+            # Create a default annotation for this line
+            annotations_instance = AnnotationPicker(line)
+            setattr(line, attr_name, annotations_instance)
+        texts=[text if custom else None for text, custom in zip(data['text'][rows].tolist(), data['custom'][rows])]
+        annotations.extend(annotations_instance.annotate_many(line, data['index'][rows], texts,
+                                                              data['offset'][rows], draw=False))
+    if annotations:
+        fig.canvas.draw_idle()
+    return annotations
+
+
+def attach_source(line, y, x=None):
+    """
+    Attach full resolution data to a Line2D that displays a decimated version.
+    Picking, middle-click sliding and the formatter then use the nearest
+    sample of the source, and annotation indices are source indices.
+    Formatters must use get_point(line, index), not line.get_xydata()[index].
+    Input:
+        line: The matplotlib line object (plotted from decimated data)
+        y: Array of y values, or the filename of a .npy file, which is
+            memory-mapped. A file or array with shape (N, 2) holds x and y.
+        x: Sorted array of x values (or .npy filename). If None (and y is
+            one-dimensional), x is the sample number.
+    Returns:
+        FullResolutionSource object
+    A streaming line (see stream_line) can't have a source.
+    """
+    if getattr(line, stream_attr_name, None) is not None:
+        raise ValueError('A streaming line (see stream_line) cannot have a full resolution source')
+    if isinstance(y, str):
+        y=np.load(y, mmap_mode='r')
+    if isinstance(x, str):
+        x=np.load(x, mmap_mode='r')
+    if x is None and getattr(y, 'ndim', 1) == 2:
+        x, y = y[:,0], y[:,1]
+    source=FullResolutionSource(y, x)
+    setattr(line, source_attr_name, source)
+    return source
+
+
+def stream_line(line, key='x'):
+    """
+    Put a line in streaming mode. Use the returned LineStream's set_data()
+    instead of line.set_data(), and the annotations follow their samples.
+    Annotations already on the line are anchored at their current index.
+    Input:
+        line: The matplotlib line object
+        key: 'x' to anchor annotations to the x value of their sample (x must
+            be sorted), or 'sample' to anchor them to the absolute sample number.
+    Returns:
+        LineStream object
+    A line with a full resolution source (see attach_source) can't be
+    streamed: its annotation indices are source indices, but set_data()
+    replaces the displayed data.
+    """
+    if getattr(line, source_attr_name, None) is not None:
+        raise ValueError('A line with a full resolution source (see attach_source) cannot be streamed')
+    stream=getattr(line, stream_attr_name, None)
+    if stream is None or stream.key != key:
+        stream=LineStream(line, key)
+        setattr(line, stream_attr_name, stream)
+        for annotation in get_registry().annotations():
+            if annotation.line is line and annotation.ref_artist.get_figure() is not None:
+                stream.add(annotation)
+    return stream
+
+
+def get_point(line, index):
+    """
+    Returns the (x, y) data of an annotation index on this line, for use in
+    formatters. This is the line data, or the full resolution source if one
+    is attached (see attach_source).
+    """
+    return get_line_index(line).point(index)
+
+
+def get_line_index(line):
+    """
+    Returns the LineIndex cached on this line, creating or rebuilding it
+    if the line data has changed.
+    """
+    line_index=getattr(line, index_attr_name, None)
+    if line_index is None:
+        line_index=LineIndex(line)
+        setattr(line, index_attr_name, line_index)
+    else:
+        line_index.update()
+    return line_index
+
+
+def get_dispatcher(canvas):
+    """Returns the AnnotationDispatcher attached to this canvas, creating it if needed."""
+    dispatcher=getattr(canvas, dispatch_attr_name, None)
+    if dispatcher is None:
+        dispatcher=AnnotationDispatcher(canvas)
+        setattr(canvas, dispatch_attr_name, dispatcher)
+    return dispatcher
+
+
+def enable_instrumentation():
+    """
+    Start recording call counts and timings of the annotation hot paths:
+    pick_event, onpick, save_offset, update_offset, finalize_offset,
+    formatter, and the canvas draws and blits done by this module.
+    Any previous recording is cleared.
+    """
+    global _histograms
+    _histograms={}
+
+
+def disable_instrumentation():
+    """Stop recording. The overhead is then a single check per call."""
+    global _histograms
+    _histograms=None
+
+
+def get_instrumentation():
+    """
+    Returns the recorded timings as {name: stats}, where stats is a dict of
+    count, and total, mean, min, max, p50, p90 and p99 in milliseconds.
+    Percentiles are estimated from power-of-two buckets.
+    """
+    report={}
+    for name, histogram in (_histograms or {}).items():
+        report[name]=dict(count=histogram.count, total=histogram.total*1e3,
+            mean=histogram.total/histogram.count*1e3, min=histogram.min*1e3,
+            max=histogram.max*1e3, p50=histogram.percentile(50)*1e3,
+            p90=histogram.percentile(90)*1e3, p99=histogram.percentile(99)*1e3)
+    return report
+
+
+def dump_instrumentation(file=None):
+    """Print a table of the recorded timings (milliseconds), slowest total first."""
+    file=sys.stdout if file is None else file
+    report=get_instrumentation()
+    print('{0:<16}{1:>8}{2:>11}{3:>9}{4:>9}{5:>9}{6:>9}'.format(
+        'name', 'count', 'total', 'mean', 'p50', 'p99', 'max'), file=file)
+    for name in sorted(report, key=lambda name: -report[name]['total']):
+        stats=report[name]
+        print('{0:<16}{1:>8}{2:>11.2f}{3:>9.3f}{4:>9.3f}{5:>9.3f}{6:>9.3f}'.format(
+            name, stats['count'], stats['total'], stats['mean'], stats['p50'],
+            stats['p99'], stats['max']), file=file)
+
+
+def get_registry():
+    """Returns the module's AnnotationRegistry, creating it if needed."""
+    global _registry
+    if _registry is None:
+        _registry=AnnotationRegistry()
+    return _registry
+
+
+def get_blit_manager(canvas):
+    """Returns the BlitManager attached to this canvas, creating it if needed."""
+    blit_manager=getattr(canvas, blit_attr_name, None)
+    if blit_manager is None:
+        blit_manager=BlitManager(canvas)
+        setattr(canvas, blit_attr_name, blit_manager)
+    return blit_manager
+
+
+def get_layout(canvas):
+    """Returns the AnnotationLayout attached to this canvas, creating it if needed."""
+    layout=getattr(canvas, layout_attr_name, None)
+    if layout is None:
+        layout=AnnotationLayout(canvas)
+        setattr(canvas, layout_attr_name, layout)
+    return layout
+
+
+def get_pick_index(ax):
+    """Returns the AxesPickIndex cached on this axes, creating it if needed."""
+    pick_index=getattr(ax, pick_attr_name, None)
+    if pick_index is None:
+        pick_index=AxesPickIndex(ax)
+        setattr(ax, pick_attr_name, pick_index)
+    return pick_index
+
+
+def export_annotated(spec, datasets, filenames, plot=None, processes=None, **savefig_kwargs):
+    """
+    Render one annotated figure per dataset, without a GUI, on the Agg backend.
+    The figures are rendered in a pool of processes (one per core by default).
+    Input:
+        spec: AnnotationSpec applied to every figure
+        datasets: Sequence of datasets. With the default plot, a dataset is a
+            dict {label: data}, a sequence of data, or the filename of a .npy
+            or .npz file. Each data is (x, y), an (N, 2) array, or y alone.
+        filenames: Output files, one per dataset. The extension chooses the
+            format (.png, .svg, ...).
+        plot: Function fcn(figure, dataset) that plots a dataset on a new
+            figure. The default plots every line in a single axes, with a
+            legend. It must be a module level function (it is pickled).
+        processes: Number of worker processes. None for one per core, 1 to
+            render in this process.
+        All other keyword arguments will be passed to savefig.
+    Returns:
+        The list of filenames
+    """
+    if len(datasets) != len(filenames):
+        raise ValueError('One filename is needed per dataset')
+    jobs=[(spec, dataset, filename, plot, savefig_kwargs) for dataset, filename in zip(datasets, filenames)]
+    if processes == 1:
+        return [_export_one(job) for job in jobs]
+    workers=processes or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Send the jobs in chunks, so small figures don't wait on the pipe
+        chunksize=max(1, len(jobs) // (4 * workers))
+        return list(executor.map(_export_one, jobs, chunksize=chunksize))
+
+
 def subplots(*args, anno=None, **kwargs):
     """
     Identical to plt.subplots(), but  also assigns an AnnotationPicker class
@@ -375,6 +2280,123 @@ def _make_iterable(obj):
         return [obj]
 
 
+def _view_key(ax):
+    """
+    Returns a hashable key that changes whenever the data to display transform
+    of the axes changes (pan, zoom, resize, or a change in scale).
+    """
+    return (tuple(ax.viewLim.bounds), tuple(ax.bbox.bounds), ax.get_xscale(), ax.get_yscale())
+
+
+def _figure_view_key(fig):
+    """Returns a hashable key that changes whenever the figure size or the view of any axes changes."""
+    return (tuple(fig.bbox.bounds), tuple(_view_key(ax) for ax in fig.get_axes()))
+
+
+def _artist_region(artist, canvas):
+    """
+    Returns the display bbox covered by an annotation (text box and arrow),
+    padded for anti-aliasing and clipped to the figure. None if off-screen.
+    """
+    renderer=canvas.get_renderer()
+    # The box and arrow are normally only laid out when drawn
+    artist.update_positions(renderer)
+    artist.update_bbox_position_size(renderer)
+    bboxes=[artist.get_window_extent(renderer)]
+    for patch in (artist.get_bbox_patch(), getattr(artist, 'arrow_patch', None)):
+        if patch is not None:
+            bboxes.append(patch.get_window_extent(renderer))
+    region=matplotlib.transforms.Bbox.union(bboxes).padded(3)
+    return matplotlib.transforms.Bbox.intersection(region, canvas.figure.bbox)
+
+
+def _text_box(artist, renderer):
+    """Returns the display bbox of an annotation's text box (without the arrow)."""
+    artist.update_positions(renderer)
+    artist.update_bbox_position_size(renderer)
+    patch=artist.get_bbox_patch()
+    if patch is None:
+        return artist.get_window_extent(renderer)
+    return patch.get_window_extent(renderer)
+
+
+def _dataset_lines(dataset):
+    """Returns a list of (label, x, y) for a dataset (see export_annotated)."""
+    if isinstance(dataset, str):
+        data=np.load(dataset)
+        if hasattr(data, 'files'):
+            # An .npz archive: one line per array. Read them, then close the file.
+            with data:
+                dataset=dict((name, data[name]) for name in data.files)
+        else:
+            dataset=[data]
+    items = dataset.items() if isinstance(dataset, dict) else \
+        (('line{0}'.format(i), data) for i, data in enumerate(dataset))
+    lines=[]
+    for label, data in items:
+        if isinstance(data, tuple):
+            x, y = data
+        elif np.ndim(data) == 2:
+            x, y = data[:,0], data[:,1]
+        else:
+            x, y = np.arange(len(data)), data
+        lines.append((label, x, y))
+    return lines
+
+
+def _plot_dataset(fig, dataset):
+    """The default plot for export_annotated: every line in one axes."""
+    ax=fig.add_subplot(111)
+    for label, x, y in _dataset_lines(dataset):
+        ax.plot(x, y, label=label)
+    ax.legend()
+
+
+def _export_one(job):
+    """Render and save one annotated figure. Runs in a worker process."""
+    spec, dataset, filename, plot, savefig_kwargs = job
+    # A bare figure with an Agg canvas: no pyplot, no GUI and no callbacks.
+    fig=matplotlib.figure.Figure()
+    FigureCanvasAgg(fig)
+    (_plot_dataset if plot is None else plot)(fig, dataset)
+    spec.apply(fig)
+    fig.savefig(filename, **savefig_kwargs)
+    return filename
+
+
+def _annotation_zorder(annotation):
+    """
+    Sort key for the drawing order of an annotation: by axes, then by zorder,
+    then by creation. The last one drawn is on top.
+    """
+    artist=annotation.ref_artist
+    ax=artist.axes
+    axes=artist.get_figure().get_axes()
+    return (ax.get_zorder(), axes.index(ax), artist.get_zorder(), annotation.id)
+
+
+def _bbox_inside(inner, outer):
+    """True if the inner bbox is entirely within the outer bbox."""
+    return inner.x0 >= outer.x0 and inner.y0 >= outer.y0 and \
+        inner.x1 <= outer.x1 and inner.y1 <= outer.y1
+
+
+def _new_lines(ax):
+    """
+    Returns the lines added to the axes since the last call.
+    Lines are appended to ax.lines, so we remember how many there were and
+    which one was last. If lines were removed, the whole axes is returned.
+    """
+    lines=ax.lines
+    count=len(lines)
+    seen_count, seen_last = getattr(ax, seen_attr_name, (0, None))
+    # Weak reference, so a removed line isn't kept alive by the axes
+    setattr(ax, seen_attr_name, (count, weakref.ref(lines[-1]) if count else None))
+    if seen_count == 0 or count < seen_count or lines[seen_count-1] is not seen_last():
+        return list(lines) # First time, or lines were removed. Check them all.
+    return list(lines[seen_count:])
+
+
 def _find_annotations_instance(artist):
     """
     Find the controlling Annotations instance for this artists.
@@ -384,9 +2406,9 @@ def _find_annotations_instance(artist):
     if hasattr(artist, attr_name):
         # Instance is attached to the artist itself
         return getattr(artist, attr_name)
-    elif hasattr(artist, 'get_axes' ) and hasattr(artist.get_axes(), attr_name):
+    elif getattr(artist, 'axes', None) is not None and hasattr(artist.axes, attr_name):
         # Instance is attached to the axes
-        return getattr(artist.get_axes(), attr_name)
+        return getattr(artist.axes, attr_name)
     elif hasattr(artist, 'get_figure') and hasattr(artist.get_figure(), attr_name):
         # Instance is attached to the figure
         return getattr(artist.get_figure(), attr_name)
@@ -410,6 +2432,7 @@ def _clear_annotations(artist):
 ###########################
 # Canvas Callback functions
 ###########################
+@_instrumented('pick_event')
 def _on_pick_event(event):
     """
     This is what initially gets called when ANY artist in the figure with
@@ -430,22 +2453,45 @@ def _on_figure_enter_event(event):
     picker enabled so that new lines can be annotated.
     """
     fig=event.canvas.figure
-    # Only lines that are not already pickable will be updated.
-    lines=[line for ax in fig.axes for line in ax.lines if not line.pickable()]
+    # Only new lines on axes with an AnnotationPicker (on the axes or figure)
+    # are checked, and only if they are not already pickable.
+    lines=[line for ax in fig.axes if hasattr(ax, attr_name) or hasattr(fig, attr_name)
+           for line in _new_lines(ax) if not line.pickable()]
     for line in lines:
         # The controlling Annotations instance is either in the axes or figure.
         annotations_instance=_find_annotations_instance(line)
         if annotations_instance is not None:
-            line.set_picker(annotations_instance.tolerance)
+            annotations_instance._enable_picker(line)
     # We may need to update legends if the user manually plotted or deleted a line.
     #legend_update(fig, draw=True) #Draw if a change was detected
+
+
+def _on_motion_event(event):
+    """
+    When the mouse moves, update the hover tooltip of the AnnotationPicker
+    controlling the axes under the cursor (if hover is enabled), and hide
+    tooltips on any other axes.
+    """
+    canvas=event.canvas
+    if get_dispatcher(canvas).active is not None:
+        return # Dragging an annotation
+    ax=event.inaxes
+    blit_manager=get_blit_manager(canvas)
+    for tooltip in blit_manager.overlays:
+        if tooltip.get_visible() and tooltip.axes is not ax:
+            tooltip.set_visible(False)
+            blit_manager.update_overlay(tooltip)
+    if ax is None:
+        return
+    annotations_instance=_find_annotations_instance(ax)
+    if annotations_instance is not None and annotations_instance.hover:
+        annotations_instance._onhover(event)
     
     
 ###########################
 # TEST
 ###########################
 if __name__ == '__main__':
-    import numpy as np
     plt.ion()
     # Use our subplots wrapper to make sure annotations are enabled
     fig,ax=subplots(2,1)
@@ -464,7 +2510,7 @@ if __name__ == '__main__':
     ax[1].plot(x,2*x+7, label='New line')
     # Create custom string for 2nd axes
     def custom_text(line,ind):
-        xy=line.get_xydata()[ind]
+        xy=get_point(line,ind)
         custom='Custom text\nData[{0}]: {1:.9}, {2:.9}'.format(ind,xy[0],xy[1])
         return custom
     
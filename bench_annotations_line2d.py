@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Headless benchmarks for the annotations_line2d module.
+Runs on the Agg backend and injects synthetic pick, press, motion and release
+events to time the interactive hot paths:
+    create       : AnnotationPicker._onpick (ctrl-click on a line)
+    left-drag    : one motion event while dragging an annotation
+    middle-slide : one motion event while sliding an annotation along the line
+    remove       : right-click press and release on an annotation
+Line sizes and annotation counts are swept separately. Each result is printed
+as one JSON object per line, so runs can be compared to catch regressions.
+
+Usage:
+    python bench_annotations_line2d.py [--quick] [--output bench_output.txt]
+
+test_annotations_line2d.py drives each operation once with the same helpers.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import MouseEvent, PickEvent
+import numpy as np
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+import annotations_line2d
+
+###########################
+# Globals
+###########################
+LINE_SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+ANNOTATION_COUNTS = [1, 10, 100, 1000, 10**4]
+QUICK_LINE_SIZES = [10**3, 10**5]
+QUICK_ANNOTATION_COUNTS = [1, 100]
+
+
+###########################
+# Helpers
+###########################
+def percentiles(samples):
+    """Summary statistics in milliseconds."""
+    ms = np.asarray(samples) * 1000.
+    return dict(n=len(ms), mean=float(ms.mean()), p50=float(np.percentile(ms, 50)),
+                p90=float(np.percentile(ms, 90)), p99=float(np.percentile(ms, 99)),
+                max=float(ms.max()))
+
+
+def mouse(canvas, name, x, y, button=None, key=None):
+    """Send a synthetic mouse event through the canvas callbacks. Returns the event."""
+    event = MouseEvent(name, canvas, x, y, button=button, key=key)
+    canvas.callbacks.process(name, event)
+    return event
+
+
+def box_center(annotation):
+    """Display coordinates of the center of the annotation text box."""
+    renderer = annotation.canvas.get_renderer()
+    bbox = annotation.ref_artist.get_bbox_patch().get_window_extent(renderer)
+    return ((bbox.x0 + bbox.x1) / 2., (bbox.y0 + bbox.y1) / 2.)
+
+
+def make_figure(npoints, nannotations, seed=0):
+    """
+    A figure with one random-walk line of npoints, with nannotations already
+    on it. Returns (fig, ax, line, anno).
+    """
+    rng = np.random.RandomState(seed)
+    fig, ax = plt.subplots()
+    line, = ax.plot(np.arange(npoints, dtype=float), rng.standard_normal(npoints).cumsum(), label='bench')
+    anno = annotations_line2d.AnnotationPicker(fig)
+    fig.canvas.draw()
+    if nannotations:
+        indices = np.linspace(0, npoints - 1, nannotations).astype(int)
+        anno.annotate_many(line, indices)
+    return fig, ax, line, anno
+
+
+###########################
+# Benchmarks
+###########################
+def bench_create(npoints, nannotations, repeat):
+    """Time AnnotationPicker._onpick for a ctrl-click on the line."""
+    fig, ax, line, anno = make_figure(npoints, nannotations)
+    rng = np.random.RandomState(1)
+    samples = []
+    for index in rng.randint(0, npoints, repeat):
+        x, y = ax.transData.transform(line.get_xydata()[index])
+        mouseevent = MouseEvent('button_press_event', fig.canvas, x, y,
+                                button=anno.button, key=anno.key)
+        event = PickEvent('pick_event', fig.canvas, mouseevent, line, ind=[index])
+        start = time.perf_counter()
+        anno._onpick(event)
+        samples.append(time.perf_counter() - start)
+    plt.close(fig)
+    return samples
+
+
+def bench_drag(npoints, nannotations, repeat, button):
+    """Time each motion event of a left-drag (button 1) or middle-slide (button 2)."""
+    fig, ax, line, anno = make_figure(npoints, nannotations)
+    # The annotation we drag is created last, so it is on top.
+    annotation = anno.annotate(line, npoints // 4)
+    x, y = box_center(annotation)
+    mouse(fig.canvas, 'button_press_event', x, y, button=button)
+    samples = []
+    # Move across half of the axes width, so a slide visits many data points
+    for dx in np.linspace(1, ax.bbox.width / 2., repeat):
+        start = time.perf_counter()
+        mouse(fig.canvas, 'motion_notify_event', x + dx, y, button=button)
+        samples.append(time.perf_counter() - start)
+    mouse(fig.canvas, 'button_release_event', x + dx, y, button=button)
+    plt.close(fig)
+    return samples
+
+
+def bench_remove(npoints, nannotations, repeat):
+    """Time a right-click press and release on an annotation."""
+    fig, ax, line, anno = make_figure(npoints, nannotations)
+    rng = np.random.RandomState(2)
+    annotations = [anno.annotate(line, index) for index in rng.randint(0, npoints, repeat)]
+    samples = []
+    # Remove the topmost first, so the click always lands on the one we want.
+    for annotation in reversed(annotations):
+        x, y = box_center(annotation)
+        start = time.perf_counter()
+        mouse(fig.canvas, 'button_press_event', x, y, button=3)
+        mouse(fig.canvas, 'button_release_event', x, y, button=3)
+        samples.append(time.perf_counter() - start)
+    plt.close(fig)
+    return samples
+
+
+def run(line_sizes, annotation_counts, repeat, out):
+    """Run every operation over the line sizes (1 annotation) and annotation counts (smallest line)."""
+    operations = [('create', lambda n, a: bench_create(n, a, repeat)),
+                  ('left-drag', lambda n, a: bench_drag(n, a, repeat, 1)),
+                  ('middle-slide', lambda n, a: bench_drag(n, a, repeat, 2)),
+                  ('remove', lambda n, a: bench_remove(n, a, repeat))]
+    cases = [(npoints, 1) for npoints in line_sizes] + \
+            [(line_sizes[0], count) for count in annotation_counts if count != 1]
+    for npoints, nannotations in cases:
+        for name, operation in operations:
+            result = dict(operation=name, points=npoints, annotations=nannotations,
+                          backend=matplotlib.get_backend(), matplotlib=matplotlib.__version__)
+            # The module prints annotation text after a slide. Keep stdout for results.
+            with contextlib.redirect_stdout(sys.stderr):
+                samples = operation(npoints, nannotations)
+            result.update(percentiles(samples))
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+
+
+###########################
+# Main
+###########################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--quick', action='store_true', help='small sweep for a fast check')
+    parser.add_argument('--repeat', type=int, default=20, help='samples per operation')
+    parser.add_argument('--output', default=None, help='file for the JSON lines (default stdout)')
+    args = parser.parse_args()
+    if args.quick:
+        line_sizes, annotation_counts = QUICK_LINE_SIZES, QUICK_ANNOTATION_COUNTS
+    else:
+        line_sizes, annotation_counts = LINE_SIZES, ANNOTATION_COUNTS
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        run(line_sizes, annotation_counts, args.repeat, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
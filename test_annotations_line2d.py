@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Smoke tests for the annotations_line2d module.
+Each interactive operation is driven once with synthetic events on the Agg
+backend, using the helpers of the benchmark script.
+
+Usage:
+    python -m pytest test_annotations_line2d.py
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import MouseEvent, PickEvent
+import io
+import json
+import numpy as np
+import pytest
+
+import annotations_line2d
+import bench_annotations_line2d as bench
+
+
+def live_annotations(fig):
+    return annotations_line2d.get_dispatcher(fig.canvas).annotations
+
+
+def test_create():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    x, y = ax.transData.transform(line.get_xydata()[100])
+    mouseevent = MouseEvent('button_press_event', fig.canvas, x, y, button=anno.button, key=anno.key)
+    anno._onpick(PickEvent('pick_event', fig.canvas, mouseevent, line, ind=[100]))
+    annotation, = live_annotations(fig)
+    assert annotation.index == 100
+    assert tuple(annotation.ref_artist.xy) == tuple(line.get_xydata()[100])
+    plt.close(fig)
+
+
+def test_left_drag():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    annotation = anno.annotate(line, 250)
+    position = annotation.ref_artist.get_position()
+    x, y = bench.box_center(annotation)
+    bench.mouse(fig.canvas, 'button_press_event', x, y, button=1)
+    bench.mouse(fig.canvas, 'motion_notify_event', x + 50, y, button=1)
+    bench.mouse(fig.canvas, 'button_release_event', x + 50, y, button=1)
+    assert annotation.index == 250
+    assert annotation.ref_artist.get_position()[0] > position[0]
+    plt.close(fig)
+
+
+def test_middle_slide():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    annotation = anno.annotate(line, 250)
+    x, y = bench.box_center(annotation)
+    bench.mouse(fig.canvas, 'button_press_event', x, y, button=2)
+    bench.mouse(fig.canvas, 'motion_notify_event', x + 50, y, button=2)
+    bench.mouse(fig.canvas, 'button_release_event', x + 50, y, button=2)
+    assert annotation.index > 250
+    assert tuple(annotation.ref_artist.xy) == tuple(line.get_xydata()[annotation.index])
+    plt.close(fig)
+
+
+def test_remove():
+    fig, ax, line, anno = bench.make_figure(1000, 10)
+    annotation = anno.annotate(line, 250)
+    x, y = bench.box_center(annotation)
+    bench.mouse(fig.canvas, 'button_press_event', x, y, button=3)
+    bench.mouse(fig.canvas, 'button_release_event', x, y, button=3)
+    assert annotation.ref_artist.get_figure() is None
+    assert annotation not in live_annotations(fig)
+    assert len(live_annotations(fig)) == 10
+    plt.close(fig)
+
+
+def test_remove_after_motion():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    annotation = anno.annotate(line, 250)
+    x, y = bench.box_center(annotation)
+    bench.mouse(fig.canvas, 'button_press_event', x, y, button=3)
+    bench.mouse(fig.canvas, 'motion_notify_event', x + 5, y, button=3)
+    bench.mouse(fig.canvas, 'button_release_event', x + 5, y, button=3)
+    assert annotation.ref_artist.get_figure() is None
+    assert annotation not in live_annotations(fig)
+    plt.close(fig)
+
+
+def test_remove_all():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    annotations = anno.annotate_many(line, [100, 200, 300])
+    first = annotations[0]
+    annotations.remove(first) # Only drops it from the list
+    assert first in live_annotations(fig)
+    annotations.remove_all()
+    assert len(annotations) == 0
+    assert live_annotations(fig) == set([first])
+    plt.close(fig)
+
+
+def test_benchmark_quick():
+    out = io.StringIO()
+    bench.run([1000], [1, 10], 1, out)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert set(result['operation'] for result in results) == \
+        set(['create', 'left-drag', 'middle-slide', 'remove'])
+    assert all(result['n'] == 1 for result in results)
+
+
+def test_source_formatter():
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    source = np.column_stack((np.linspace(0, 999, 100000), np.arange(100000.)))
+    annotations_line2d.attach_source(line, source)
+    anno.formatter = lambda line, index: '{0:.1f}'.format(annotations_line2d.get_point(line, index)[1])
+    annotation = anno.annotate(line, 50000)
+    assert annotation.ref_artist.get_text() == '50000.0'
+    plt.close(fig)
+
+
+def test_stream_source_exclusive():
+    fig, ax, line, anno = bench.make_figure(100, 0)
+    annotations_line2d.attach_source(line, np.arange(1000.))
+    with pytest.raises(ValueError):
+        annotations_line2d.stream_line(line)
+    line, = ax.plot(np.arange(100.))
+    annotations_line2d.stream_line(line)
+    with pytest.raises(ValueError):
+        annotations_line2d.attach_source(line, np.arange(1000.))
+    plt.close(fig)
+
+
+def test_layout_after_slide():
+    fig, ax = plt.subplots()
+    line, = ax.plot(np.arange(100.), np.zeros(100))
+    anno = annotations_line2d.AnnotationPicker(fig, auto_layout=True)
+    fig.canvas.draw()
+    first = anno.annotate(line, 20)
+    x, y = bench.box_center(first)
+    # Slide to the right until the annotation reaches index 50
+    dx = ax.transData.transform((50.4, 0))[0] - ax.transData.transform((20, 0))[0]
+    bench.mouse(fig.canvas, 'button_press_event', x, y, button=2)
+    bench.mouse(fig.canvas, 'motion_notify_event', x + dx, y, button=2)
+    bench.mouse(fig.canvas, 'button_release_event', x + dx, y, button=2)
+    assert first.index == 50
+    second = anno.annotate(line, 50)
+    renderer = fig.canvas.get_renderer()
+    box = annotations_line2d._text_box(second.ref_artist, renderer)
+    assert not box.overlaps(annotations_line2d._text_box(first.ref_artist, renderer))
+    plt.close(fig)
+
+
+def test_linked_slide():
+    figures, annotations = [], []
+    for _ in range(3):
+        fig, ax = plt.subplots()
+        line, = ax.plot(np.arange(100.), np.zeros(100))
+        anno = annotations_line2d.AnnotationPicker(fig)
+        fig.canvas.draw()
+        figures.append(fig)
+        annotations.append(anno.annotate(line, 20))
+    leader, follower, streamed = annotations
+    stream = annotations_line2d.stream_line(streamed.line)
+    annotations_line2d.link_annotations(annotations)
+    # A click builds the follower's hit-test grid before the slide
+    bench.mouse(figures[1].canvas, 'button_press_event', 1, 1, button=1)
+    bench.mouse(figures[1].canvas, 'button_release_event', 1, 1, button=1)
+    ax = leader.ref_artist.axes
+    x, y = bench.box_center(leader)
+    dx = ax.transData.transform((60.4, 0))[0] - ax.transData.transform((20, 0))[0]
+    bench.mouse(figures[0].canvas, 'button_press_event', x, y, button=2)
+    bench.mouse(figures[0].canvas, 'motion_notify_event', x + dx, y, button=2)
+    bench.mouse(figures[0].canvas, 'button_release_event', x + dx, y, button=2)
+    assert leader.index == follower.index == streamed.index == 60
+    # The follower is found where it moved to
+    figures[1].canvas.draw()
+    x, y = bench.box_center(follower)
+    bench.mouse(figures[1].canvas, 'button_press_event', x, y, button=3)
+    bench.mouse(figures[1].canvas, 'button_release_event', x, y, button=3)
+    assert follower.ref_artist.get_figure() is None
+    # The streamed follower is anchored to its new sample
+    stream.set_data(np.arange(10., 110.), np.zeros(100))
+    assert streamed.index == 50
+    for fig in figures:
+        plt.close(fig)
+
+
+def test_save_load(tmp_path):
+    fig, ax, line, anno = bench.make_figure(1000, 0)
+    annotations = anno.annotate_many(line, [100, 200], offsets=[(10, 20), (-30, 40)])
+    anno.annotate(line, 300, 'custom')
+    filename = str(tmp_path / 'session.npz')
+    annotations_line2d.save_annotations(fig, filename)
+    fig2, ax2, line2, anno2 = bench.make_figure(1000, 0)
+    # Rendering is left to the event loop
+    requests = []
+    fig2.canvas.draw_idle = lambda: requests.append(True)
+    loaded = annotations_line2d.load_annotations(fig2, filename)
+    assert requests == [True]
+    assert [a.index for a in loaded] == [100, 200, 300]
+    assert [a.line for a in loaded] == [line2] * 3
+    assert [a.ref_artist.get_text() for a in loaded] == \
+        [a.ref_artist.get_text() for a in annotations] + ['custom']
+    assert [tuple(a.ref_artist.get_position()) for a in loaded][:2] == [(10, 20), (-30, 40)]
+    assert loaded[2].formatter is None
+    plt.close(fig)
+    plt.close(fig2)
+
+
+def test_export(tmp_path):
+    y = np.sin(np.arange(500.) / 20)
+    np.savez(str(tmp_path / 'data.npz'), a=y, b=np.column_stack((np.arange(500.), -y)))
+    filenames = [str(tmp_path / 'one.png'), str(tmp_path / 'two.svg')]
+    spec = annotations_line2d.AnnotationSpec(rule='peaks', count=2)
+    result = annotations_line2d.export_annotated(spec, [{'a': y}, str(tmp_path / 'data.npz')],
+                                                 filenames, processes=1)
+    assert result == filenames
+    assert all((tmp_path / name).stat().st_size > 0 for name in ('one.png', 'two.svg'))